@@ -0,0 +1,241 @@
+"""Benchmark di universal_notifier.send su un Home Assistant con servizi finti.
+
+Uso (dalla radice del repository, con homeassistant installato):
+
+    python benchmarks/bench_send.py                        # tutti gli scenari
+    python benchmarks/bench_send.py -s mix_50 -n 500       # uno scenario
+    python benchmarks/bench_send.py --latency 0.02 --failure-rate 0.05
+    python benchmarks/bench_send.py -o current.json --baseline baseline.json
+
+Il risultato è un JSON (stabile, ordinato) confrontabile tra esecuzioni:
+con --baseline il processo termina con codice 1 se uno scenario peggiora
+oltre --tolerance (p50 della latenza o chiamate al secondo).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from homeassistant.util import dt as dt_util  # noqa: E402
+
+from custom_components.universal_notifier import CONFIG_SCHEMA, async_setup  # noqa: E402
+from custom_components.universal_notifier.const import DOMAIN, SERVICE_SEND  # noqa: E402
+
+from stub_hass import StubRegistry, async_create_hass  # noqa: E402
+
+FORMAT_VERSION = 1
+PERCENTILES = (50, 95, 99)
+
+# nome -> (target, quota vocale, DND attivo, chiamate concorrenti, tipo/alt_service)
+SCENARIOS = {
+    "targets_1": (1, 0.0, False, 1, None),
+    "targets_10": (10, 0.0, False, 1, None),
+    "targets_50": (50, 0.0, False, 1, None),
+    "mix_10": (10, 0.5, False, 1, None),
+    "mix_50": (50, 0.5, False, 1, None),
+    "mix_50_dnd": (50, 0.5, True, 1, None),
+    "voice_10": (10, 1.0, False, 1, None),
+    "burst_20x10": (10, 0.5, False, 20, None),
+    "burst_50x1": (1, 0.0, False, 50, None),
+    "alt_photo_10": (10, 0.0, False, 1, "photo"),
+}
+
+
+def build_config(targets: int, voice_ratio: float, dnd: bool) -> tuple:
+    """configuration.yaml dello scenario: (config validata, alias dei target)."""
+    voice = round(targets * voice_ratio)
+    channels = {}
+    for idx in range(voice):
+        channels[f"speaker_{idx}"] = {
+            "service": "tts.speak",
+            "target": "tts.stub_provider",
+            "service_data": {"media_player_entity_id": f"media_player.speaker_{idx}"},
+            "is_voice": True,
+        }
+    for idx in range(targets - voice):
+        channels[f"visual_{idx}"] = {
+            "service": "telegram_bot.send_message",
+            "target": str(100000 + idx),
+            "alt_services": {
+                "photo": {"service": "telegram_bot.send_photo"},
+                "announce": {"service": "notify.stub_phone"},
+            },
+        }
+
+    # DND che copre (o esclude) l'orario corrente, per risultati stabili
+    now = dt_util.now()
+    if dnd:
+        window = {"start": "00:00:00", "end": "23:59:59"}
+    else:
+        start = now + timedelta(hours=2)
+        window = {"start": start.strftime("%H:%M"), "end": (start + timedelta(minutes=1)).strftime("%H:%M")}
+
+    config = CONFIG_SCHEMA({DOMAIN: {"channels": channels, "dnd": window}})
+    return config, list(channels)
+
+
+async def async_run_scenario(
+    name: str, iterations: int, warmup: int, latency: float, jitter: float,
+    failure_rate: float, seed: int,
+) -> dict:
+    targets, voice_ratio, dnd, concurrency, service_type = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        stubs = StubRegistry(hass, latency, jitter, failure_rate, seed)
+        for service in (
+            "tts.speak", "telegram_bot.send_message", "telegram_bot.send_photo", "notify.stub_phone",
+        ):
+            stubs.add(service)
+        stubs.add_volume_set()
+
+        config, aliases = build_config(targets, voice_ratio, dnd)
+        for alias in aliases:
+            if alias.startswith("speaker_"):
+                hass.states.async_set(f"media_player.{alias}", "idle", {"volume_level": 0.1})
+        assert await async_setup(hass, config)
+
+        # wait: la latenza misurata comprende le chiamate ai servizi a valle
+        data = {"message": "Benchmark: lavatrice terminata.", "title": "Casa", "targets": aliases, "wait": True}
+        if service_type:
+            data["data"] = {"type": service_type, "url": "http://localhost/snapshot.jpg"}
+
+        async def async_send():
+            start = time.perf_counter()
+            await hass.services.async_call(DOMAIN, SERVICE_SEND, dict(data), blocking=True)
+            return time.perf_counter() - start
+
+        async def async_round() -> list:
+            return await asyncio.gather(*(async_send() for _ in range(concurrency)))
+
+        for _ in range(warmup):
+            await async_round()
+        calls_before, failures_before = stubs.calls, stubs.failures
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            latencies.extend(await async_round())
+        wall = time.perf_counter() - start
+        service_calls = stubs.calls - calls_before
+        service_failures = stubs.failures - failures_before
+        # Senza chiamate ai servizi finti il benchmark non misurerebbe nulla a valle
+        assert service_calls > 0, f"{name}: nessuna chiamata ai servizi finti"
+
+        # Allocazioni in un passaggio separato: tracemalloc rallenta le misure
+        alloc_rounds = max(1, min(iterations, 50))
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        for _ in range(alloc_rounds):
+            await async_round()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        await hass.async_stop(force=True)
+
+    latencies.sort()
+    calls = len(latencies)
+    result = {
+        "targets": targets,
+        "voice_ratio": voice_ratio,
+        "dnd": dnd,
+        "concurrency": concurrency,
+        "service_type": service_type,
+        "calls": calls,
+        "calls_per_sec": round(calls / wall, 1) if wall else None,
+        "mean_ms": round(sum(latencies) / calls * 1000, 3),
+        "service_calls_per_call": round(service_calls / calls, 2),
+        "service_failures": service_failures,
+        "alloc_peak_kb": round((peak - baseline) / 1024, 1),
+        "retained_bytes_per_call": round((current - baseline) / (alloc_rounds * concurrency)),
+    }
+    for quantile in PERCENTILES:
+        idx = max(0, math.ceil(quantile / 100 * calls) - 1)
+        result[f"p{quantile}_ms"] = round(latencies[idx] * 1000, 3)
+    return result
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Scenari peggiorati oltre la tolleranza rispetto al baseline."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if previous.get("p50_ms") and result["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {previous['p50_ms']} -> {result['p50_ms']} ms")
+        if previous.get("calls_per_sec") and result["calls_per_sec"] < previous["calls_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: calls/s {previous['calls_per_sec']} -> {result['calls_per_sec']}")
+    return regressions
+
+
+async def async_main(args) -> int:
+    names = args.scenario or list(SCENARIOS)
+    report = {
+        "format": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "settings": {
+            "iterations": args.iterations, "warmup": args.warmup, "latency": args.latency,
+            "jitter": args.jitter, "failure_rate": args.failure_rate, "seed": args.seed,
+        },
+        "scenarios": {},
+    }
+    for name in names:
+        result = await async_run_scenario(
+            name, args.iterations, args.warmup, args.latency, args.jitter,
+            args.failure_rate, args.seed,
+        )
+        report["scenarios"][name] = result
+        print(
+            f"{name:<14} {result['calls_per_sec']:>9} call/s  p50 {result['p50_ms']:>8} ms  "
+            f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+            f"peak {result['alloc_peak_kb']:>8} KiB",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS), help="Scenario (ripetibile)")
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="Giri misurati per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="Giri iniziali non misurati")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latenza simulata dei servizi (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variazione casuale della latenza (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Frazione di chiamate che falliscono")
+    parser.add_argument("--seed", type=int, default=0, help="Seme per latenze ed errori simulati")
+    parser.add_argument("-o", "--output", help="File JSON dei risultati (default: stdout)")
+    parser.add_argument("--baseline", help="JSON di un'esecuzione precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Peggioramento ammesso (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # Gli errori simulati non devono riempire l'output
+    logging.basicConfig(level=logging.CRITICAL)
+    return asyncio.run(async_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
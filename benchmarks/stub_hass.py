@@ -0,0 +1,94 @@
+"""Home Assistant per i benchmark: core reale e servizi di destinazione finti.
+
+Gli helper usati dall'integrazione (bus, state machine, Store, tracking
+degli stati) girano sul core vero, creato in una cartella temporanea e
+mai avviato con integrazioni. Tutti i servizi chiamati dai canali
+(notify, tts, telegram_bot, media_player) sono invece stub che registrano
+le chiamate e simulano latenza ed errori: niente rete, niente dispositivi.
+"""
+
+import asyncio
+import random
+
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+
+
+class StubService:
+    """Servizio finto: conta le chiamate, attende 'latency' (± jitter) e fallisce con 'failure_rate'."""
+
+    def __init__(self, latency: float, jitter: float, failure_rate: float, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._rng = rng
+
+    async def __call__(self, call: ServiceCall):
+        self.calls += 1
+        delay = self.latency + self._rng.uniform(-self.jitter, self.jitter) if self.latency else 0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            self.failures += 1
+            raise HomeAssistantError("Errore simulato")
+
+
+class StubRegistry:
+    """Registra gli stub su hass con latenza ed errori di default (sovrascrivibili per servizio)."""
+
+    def __init__(
+        self, hass: HomeAssistant, latency: float = 0.0, jitter: float = 0.0,
+        failure_rate: float = 0.0, seed: int = 0,
+    ):
+        self._hass = hass
+        self._defaults = (latency, jitter, failure_rate)
+        self._rng = random.Random(seed)
+        self.services = {}
+
+    def add(self, service: str, latency: float = None, failure_rate: float = None) -> StubService:
+        if service in self.services:
+            return self.services[service]
+        default_latency, jitter, default_failure_rate = self._defaults
+        stub = StubService(
+            default_latency if latency is None else latency, jitter,
+            default_failure_rate if failure_rate is None else failure_rate, self._rng,
+        )
+        domain, name = service.split(".", 1)
+        # Metodo legato: un'istanza con __call__ asincrono non viene riconosciuta
+        # come coroutine e finirebbe nell'executor senza essere mai attesa
+        self._hass.services.async_register(domain, name, stub.__call__)
+        self.services[service] = stub
+        return stub
+
+    def add_volume_set(self):
+        """media_player.volume_set che aggiorna anche lo stato (come un player vero)."""
+        stub = self.add("media_player.volume_set", latency=0.0, failure_rate=0.0)
+
+        async def _volume_set(call: ServiceCall):
+            await stub(call)
+            entity_ids = call.data["entity_id"]
+            for entity_id in [entity_ids] if isinstance(entity_ids, str) else entity_ids:
+                state = self._hass.states.get(entity_id)
+                attributes = dict(state.attributes) if state else {}
+                attributes["volume_level"] = call.data["volume_level"]
+                self._hass.states.async_set(entity_id, "idle", attributes)
+
+        self._hass.services.async_register("media_player", "volume_set", _volume_set)
+        return stub
+
+    @property
+    def calls(self) -> int:
+        return sum(stub.calls for stub in self.services.values())
+
+    @property
+    def failures(self) -> int:
+        return sum(stub.failures for stub in self.services.values())
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    """Core minimale: nessuna integrazione caricata, fuso orario UTC."""
+    hass = HomeAssistant(config_dir)
+    await hass.config.async_set_time_zone("UTC")
+    return hass
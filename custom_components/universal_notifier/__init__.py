@@ -5,28 +5,69 @@ import random
 import re
 import voluptuous as vol
 import asyncio
+import time
+from functools import partial
 import homeassistant.helpers.config_validation as cv
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import (
+    Context, HassJob, HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback,
+)
 from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import discovery
+from homeassistant.helpers.reload import async_integration_yaml_config
+from homeassistant.helpers.service import async_register_admin_service
+from homeassistant.helpers.start import async_at_started
 from homeassistant.util import dt as dt_util
 
 # Importiamo TUTTE le costanti necessarie
 from .const import (
-    DOMAIN,
+    DOMAIN, SERVICE_SEND, SERVICE_RELOAD,
     # Config keys
     CONF_CHANNELS, CONF_ASSISTANT_NAME, CONF_DATE_FORMAT,
-    CONF_GREETINGS, CONF_TIME_SLOTS, CONF_DND, CONF_BOLD_PREFIX,
+    CONF_GREETINGS, CONF_TIME_SLOTS, CONF_DND, CONF_BOLD_PREFIX, CONF_PRIORITY_PREEMPT,
     # Service keys (Inputs)
     CONF_MESSAGE, CONF_TITLE, CONF_TARGETS, CONF_DATA, CONF_TARGET_DATA,
     CONF_PRIORITY, CONF_SKIP_GREETING, CONF_INCLUDE_TIME, CONF_OVERRIDE_GREETINGS,
+    CONF_WAIT, CONF_DEDUP_WINDOW, CONF_COALESCE, CONF_RESTORE_VOLUME,
+    CONF_METRICS, CONF_DELIVERED_EVENT, CONF_GROUPS,
     # Inner Channel keys
     CONF_SERVICE, CONF_SERVICE_DATA, CONF_TARGET, CONF_ENTITY_ID,
-    CONF_IS_VOICE, CONF_ALT_SERVICES, CONF_TYPE,
+    CONF_IS_VOICE, CONF_ALT_SERVICES, CONF_TYPE, CONF_TIMEOUT,
+    CONF_RETRY, CONF_CIRCUIT_BREAKER, CONF_RATE_LIMIT, CONF_DND_POLICY, CONF_FANOUT,
+    CONF_SPLIT_SENTENCES, CONF_TAGS, CONF_JOURNAL_TTL,
+    # Retry / Circuit breaker keys
+    CONF_ATTEMPTS, CONF_BACKOFF, CONF_MAX_BACKOFF, CONF_JITTER, CONF_RETRY_ON,
+    CONF_THRESHOLD, CONF_COOLDOWN,
+    # Rate limit keys
+    CONF_RATE, CONF_BURST, CONF_OVERFLOW, CONF_MAX_QUEUE,
     # Defaults
     DEFAULT_NAME, DEFAULT_DATE_FORMAT, DEFAULT_INCLUDE_TIME,
     DEFAULT_GREETINGS, DEFAULT_TIME_SLOTS, DEFAULT_DND, 
-    DEFAULT_BOLD_PREFIX, PRIORITY_VOLUME, COMPANION_COMMANDS
+    DEFAULT_BOLD_PREFIX, PRIORITY_VOLUME, COMPANION_COMMANDS,
+    DEFAULT_PRIORITY_PREEMPT, PREEMPT_MODES, DEFAULT_WAIT, SHUTDOWN_DRAIN_TIMEOUT,
+    DEFAULT_TIMEOUT, STATUS_SKIPPED_DND, STATUS_UNKNOWN, STATUS_CIRCUIT_OPEN,
+    DEFAULT_ATTEMPTS, DEFAULT_BACKOFF, DEFAULT_MAX_BACKOFF, DEFAULT_JITTER,
+    DEFAULT_RETRY_ON, ERROR_KINDS, DEFAULT_THRESHOLD, DEFAULT_COOLDOWN,
+    EVENT_CIRCUIT_CHANGED, DEFAULT_DEDUP_WINDOW, DEFAULT_COALESCE, STATUS_DUPLICATE,
+    OVERFLOW_POLICIES, OVERFLOW_QUEUE, DEFAULT_BURST, DEFAULT_MAX_QUEUE,
+    DEFAULT_RESTORE_VOLUME, PLAYBACK_START_TIMEOUT, PLAYBACK_MAX_WAIT, SPEECH_CHARS_PER_SECOND,
+    DND_POLICIES, DND_DROP, DEFAULT_DND_POLICY, STATUS_DEFERRED,
+    FANOUT_MODES, FANOUT_PER_CHAT, DEFAULT_FANOUT,
+    TELEGRAM_TEXT_LIMIT, TELEGRAM_CAPTION_LIMIT, DEFAULT_SPLIT_SENTENCES,
+    DEFAULT_METRICS, DEFAULT_DELIVERED_EVENT, EVENT_DELIVERED, METRICS_CALL,
+    STAGE_CONTEXT, STAGE_RENDER, STAGE_VOLUME, DEFAULT_JOURNAL_TTL, UNKNOWN_TARGETS_SIZE,
+)
+from .runtime import NotifierState
+from .resilience import CircuitBreaker
+from .dedup import DedupCache, dedup_key
+from .delivery import (
+    DeliveryJob, DeliveryResult, DeliveryScheduler, ServiceStep, WaitStep, channel_lane,
 )
+from .volume import async_wait_playback, async_wait_spoken
+from .digest import DndBuffer
+from .journal import DeliveryJournal
+from .chunking import split_formatted, split_sentences
+from .metrics import DeliveryMetrics
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -34,56 +75,15 @@ _LOGGER = logging.getLogger(__name__)
 # HELPER FUNCTIONS
 # ==============================================================================
 
-def is_time_in_range(start_str: str, end_str: str, now_time) -> bool:
-    """Controlla se l'orario attuale è in un range (gestisce accavallamento notte)."""
-    start = dt_util.parse_time(start_str)
-    end = dt_util.parse_time(end_str)
-    if start <= end:
-        return start <= now_time <= end
-    else:
-        return start <= now_time or now_time <= end
-
-def get_current_slot_info(slots_conf: dict, now_time) -> tuple:
-    """Restituisce (nome_slot, volume) basandosi sull'ora attuale."""
-    # Se la config è vuota, usiamo i default di const.py
-    if not slots_conf:
-        slots_conf = DEFAULT_TIME_SLOTS
-
-    sorted_slots = []
-    for name, data in slots_conf.items():
-        # Parsing sicuro dell'orario
-        t_str = data.get("start")
-        t_obj = dt_util.parse_time(t_str) if t_str else None
-        vol_val = data.get("volume", 0.2)
-        if t_obj:
-            sorted_slots.append((name, t_obj, vol_val))
-    
-    # Ordina per orario di inizio
-    sorted_slots.sort(key=lambda x: x[1])
-    
-    if not sorted_slots:
-        # Fallback estremo se nessun orario è valido
-        return "default", 0.2
-
-    # Logica: Inizializziamo con l'ultimo slot della lista.
-    # Questo copre il caso "notte" (es. dalle 23:00 alle 07:00).
-    # Se sono le 02:00, il loop sotto non scatterà mai, e rimarrà valido l'ultimo slot (night).
-    current_slot = sorted_slots[-1][0]
-    current_vol = sorted_slots[-1][2]
-    
-    for name, start_time, vol_val in sorted_slots:
-        if now_time >= start_time:
-            current_slot = name
-            current_vol = vol_val
-        # Non serve break, dobbiamo trovare l'ultimo slot valido (il più recente passato)
-        
-    return current_slot, current_vol
+# Regex pre-compilate per la pulizia del testo TTS
+MARKDOWN_CHARS_RE = re.compile(r'[*_`\[\]]')
+URL_RE = re.compile(r'http\S+')
 
 def clean_text_for_tts(text: str) -> str:
     """Rimuove caratteri speciali per la sintesi vocale."""
     if not text: return ""
-    text = re.sub(r'[*_`\[\]]', '', text) # Via markdown
-    text = re.sub(r'http\S+', '', text)    # Via URL
+    text = MARKDOWN_CHARS_RE.sub('', text) # Via markdown
+    text = URL_RE.sub('', text)            # Via URL
     return text.strip()
 
 def sanitize_text_visual(text: str, parse_mode: str = None) -> str:
@@ -106,6 +106,73 @@ def apply_formatting(text: str, parse_mode: str, style: str = "bold") -> str:
         
     return text
 
+def render_voice(message: str, title: str, greeting: str) -> tuple:
+    """Testo parlato (titolo + saluto + messaggio, ripuliti). Restituisce (messaggio, titolo)."""
+    # 1. Pulizia testo per TTS
+    clean_msg = clean_text_for_tts(message)
+    clean_greet = clean_text_for_tts(greeting)
+    # 2. Incorporazione del TITOLO nel messaggio vocale
+    full_spoken_text = ""
+
+    if title:
+        clean_title = clean_text_for_tts(title)
+        if clean_title:
+            full_spoken_text += f"{clean_title}. "
+
+    if clean_greet:
+        full_spoken_text += f"{clean_greet}. "
+
+    full_spoken_text += clean_msg
+
+    # 3. Niente titolo nel payload finale per evitare errori TTS
+    return full_spoken_text, None
+
+def render_visual(
+    message: str, title: str, greeting: str, name: str, time_str: str,
+    parse_mode: str, bold_prefix: bool,
+) -> tuple:
+    """Testo visuale con prefisso [Nome - 12:00]. Restituisce (messaggio, titolo)."""
+    # 1. Sanitizzazione base
+    clean_name = sanitize_text_visual(name, parse_mode)
+    clean_time = sanitize_text_visual(time_str, parse_mode)
+    clean_msg = sanitize_text_visual(message, parse_mode)
+    clean_greet = sanitize_text_visual(greeting, parse_mode)
+    # Sanitizza anche il titolo originale se presente
+    clean_orig_title = sanitize_text_visual(title, parse_mode) if title else None
+
+    # 2. Bolding
+    if bold_prefix:
+        clean_name = apply_formatting(clean_name, parse_mode, "bold")
+        clean_time = apply_formatting(clean_time, parse_mode, "bold")
+
+    # 3. Costruzione stringa Prefisso
+    # Formato: [Nome - 12:00]
+    prefix_content = clean_name
+    if clean_time:
+        prefix_content += f" - {clean_time}"
+    clean_prefix = f"[{prefix_content}]" # Nota: niente spazio finale qui, lo gestiamo dopo
+
+    # 4. Distribuzione Prefisso
+    greeting_part = f"{clean_greet}. " if clean_greet else ""
+
+    if clean_orig_title:
+        # CASO A: Esiste un titolo -> Prefisso va nel Titolo
+        return f"{greeting_part}{clean_msg}", f"{clean_prefix} {clean_orig_title}"
+    # CASO B: Niente titolo -> Prefisso va nel Messaggio
+    # (clean_prefix + spazio + saluti + messaggio)
+    return f"{clean_prefix} {greeting_part}{clean_msg}", None
+
+def volume_step(players, level: float) -> ServiceStep:
+    """volume_set di uno o più player (non obbligatorio: se fallisce il messaggio parte comunque)."""
+    return ServiceStep("media_player", "volume_set",
+                       {"entity_id": players, "volume_level": level}, required=False)
+
+def wait_all(futures: list):
+    """Future risolto quando lo sono tutti quelli indicati (None se non ce ne sono)."""
+    if not futures:
+        return None
+    return futures[0] if len(futures) == 1 else asyncio.gather(*futures)
+
 # ==============================================================================
 # SCHEMAS
 # ==============================================================================
@@ -116,23 +183,84 @@ TIME_SLOT_SCHEMA = vol.Schema({
     vol.Optional("volume", default=0.5): vol.All(vol.Coerce(float), vol.Range(min=0, max=1)),
 })
 
+# Schema per un servizio alternativo (alt_services)
+ALT_SERVICE_SCHEMA = vol.Schema({
+    vol.Required(CONF_SERVICE): cv.service,
+    vol.Optional(CONF_SERVICE_DATA): dict,
+}, extra=vol.ALLOW_EXTRA)
+
+# Schema per la politica di retry di un canale
+RETRY_SCHEMA = vol.Schema({
+    vol.Optional(CONF_ATTEMPTS, default=DEFAULT_ATTEMPTS): vol.All(vol.Coerce(int), vol.Range(min=1, max=10)),
+    vol.Optional(CONF_BACKOFF, default=DEFAULT_BACKOFF): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_MAX_BACKOFF, default=DEFAULT_MAX_BACKOFF): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_JITTER, default=DEFAULT_JITTER): vol.All(vol.Coerce(float), vol.Range(min=0, max=1)),
+    vol.Optional(CONF_RETRY_ON, default=DEFAULT_RETRY_ON): vol.All(cv.ensure_list, [vol.In(ERROR_KINDS)]),
+})
+
+# Schema per il circuit breaker di un canale
+CIRCUIT_BREAKER_SCHEMA = vol.Schema({
+    vol.Optional(CONF_THRESHOLD, default=DEFAULT_THRESHOLD): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_COOLDOWN, default=DEFAULT_COOLDOWN): vol.All(vol.Coerce(float), vol.Range(min=1)),
+})
+
+# Schema per il rate limit (token bucket) di un canale
+RATE_LIMIT_SCHEMA = vol.Schema({
+    vol.Required(CONF_RATE): vol.All(vol.Coerce(float), vol.Range(min=0.001)),
+    vol.Optional(CONF_BURST, default=DEFAULT_BURST): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional(CONF_OVERFLOW, default=OVERFLOW_QUEUE): vol.In(OVERFLOW_POLICIES),
+    vol.Optional(CONF_MAX_QUEUE, default=DEFAULT_MAX_QUEUE): vol.All(vol.Coerce(int), vol.Range(min=1)),
+})
+
 # Schema per un canale
 CHANNEL_SCHEMA = vol.Schema({
-    vol.Required(CONF_SERVICE): cv.string,
-    vol.Optional(CONF_TARGET): cv.string,
+    vol.Required(CONF_SERVICE): cv.service,
+    # Uno o più target (es. più chat_id Telegram)
+    vol.Optional(CONF_TARGET): vol.All(cv.ensure_list, [cv.string]),
     vol.Optional(CONF_IS_VOICE, default=False): cv.boolean,
     vol.Optional(CONF_SERVICE_DATA): dict,
-    vol.Optional(CONF_ALT_SERVICES): dict
+    vol.Optional(CONF_ALT_SERVICES): vol.Schema({cv.string: ALT_SERVICE_SCHEMA}),
+    # Timeout (secondi) di ogni chiamata verso il canale
+    vol.Optional(CONF_TIMEOUT, default=DEFAULT_TIMEOUT): vol.All(vol.Coerce(float), vol.Range(min=1)),
+    vol.Optional(CONF_RETRY): RETRY_SCHEMA,
+    vol.Optional(CONF_CIRCUIT_BREAKER): CIRCUIT_BREAKER_SCHEMA,
+    vol.Optional(CONF_RATE_LIMIT): RATE_LIMIT_SCHEMA,
+    # Cosa fare dei messaggi vocali durante il DND: drop, defer, digest
+    vol.Optional(CONF_DND_POLICY, default=DEFAULT_DND_POLICY): vol.In(DND_POLICIES),
+    # Telegram con più chat: una chiamata con la lista (list) o una per chat (per_chat)
+    vol.Optional(CONF_FANOUT, default=DEFAULT_FANOUT): vol.In(FANOUT_MODES),
+    # Canali vocali: una frase alla volta, la successiva a fine riproduzione
+    vol.Optional(CONF_SPLIT_SENTENCES, default=DEFAULT_SPLIT_SENTENCES): cv.boolean,
+    # Etichette per selezionare più canali insieme (targets: ["tag:speakers"])
+    vol.Optional(CONF_TAGS, default=[]): vol.All(cv.ensure_list, [cv.string]),
+    # Secondi entro cui una consegna interrotta da un riavvio viene ripetuta (0 = mai)
+    vol.Optional(CONF_JOURNAL_TTL, default=DEFAULT_JOURNAL_TTL): vol.All(vol.Coerce(float), vol.Range(min=0)),
 })
 
 # Schema Configurazione Globale
 CONFIG_SCHEMA = vol.Schema({
     DOMAIN: vol.Schema({
         vol.Required(CONF_CHANNELS): vol.Schema({cv.string: CHANNEL_SCHEMA}),
+        # Gruppi di canali: alias, altri gruppi, tag ('tag:nome') o pattern glob ('speaker_*')
+        vol.Optional(CONF_GROUPS, default={}): vol.Schema({
+            cv.string: vol.All(cv.ensure_list, [cv.string])
+        }),
         vol.Optional(CONF_ASSISTANT_NAME, default=DEFAULT_NAME): cv.string,
         vol.Optional(CONF_DATE_FORMAT, default=DEFAULT_DATE_FORMAT): cv.string,
         vol.Optional(CONF_INCLUDE_TIME, default=DEFAULT_INCLUDE_TIME): cv.boolean,
         vol.Optional(CONF_BOLD_PREFIX, default=DEFAULT_BOLD_PREFIX): cv.boolean,
+        # Attendere le consegne prima di restituire il controllo all'automazione?
+        vol.Optional(CONF_WAIT, default=DEFAULT_WAIT): cv.boolean,
+        # Finestra (secondi) in cui i messaggi identici vengono scartati (0 = disattivo)
+        vol.Optional(CONF_DEDUP_WINDOW, default=DEFAULT_DEDUP_WINDOW): vol.All(vol.Coerce(float), vol.Range(min=0)),
+        # Accorpa nella stessa finestra i messaggi diversi ancora in coda per un canale
+        vol.Optional(CONF_COALESCE, default=DEFAULT_COALESCE): cv.boolean,
+        # Ripristina il volume precedente dei player a fine annuncio
+        vol.Optional(CONF_RESTORE_VOLUME, default=DEFAULT_RESTORE_VOLUME): cv.boolean,
+        # Tempi per fase e canale esposti come sensori diagnostici
+        vol.Optional(CONF_METRICS, default=DEFAULT_METRICS): cv.boolean,
+        # Evento universal_notifier_delivered con l'esito di ogni target
+        vol.Optional(CONF_DELIVERED_EVENT, default=DEFAULT_DELIVERED_EVENT): cv.boolean,
         # Validazione dizionario slot orari
         vol.Optional(CONF_TIME_SLOTS, default=DEFAULT_TIME_SLOTS): vol.Schema({
             cv.string: TIME_SLOT_SCHEMA
@@ -144,6 +272,8 @@ CONFIG_SCHEMA = vol.Schema({
         }),
         
         vol.Optional(CONF_GREETINGS, default=DEFAULT_GREETINGS): dict,
+        # Gestione dei messaggi in coda quando arriva una priorità
+        vol.Optional(CONF_PRIORITY_PREEMPT, default=DEFAULT_PRIORITY_PREEMPT): vol.In(PREEMPT_MODES),
     }),
 }, extra=vol.ALLOW_EXTRA)
 
@@ -159,6 +289,9 @@ SEND_SERVICE_SCHEMA = vol.Schema({
     vol.Optional(CONF_ASSISTANT_NAME): cv.string,
     vol.Optional(CONF_BOLD_PREFIX): cv.boolean,
     vol.Optional(CONF_OVERRIDE_GREETINGS): dict,
+    vol.Optional(CONF_WAIT): cv.boolean,
+    vol.Optional(CONF_DEDUP_WINDOW): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_RESTORE_VOLUME): cv.boolean,
 }, extra=vol.ALLOW_EXTRA)
 
 # ==============================================================================
@@ -172,43 +305,175 @@ async def async_setup(hass: HomeAssistant, config: dict):
         return True
     
     conf = config[DOMAIN]
-    
-    channels_config = conf[CONF_CHANNELS]
-    global_name = conf[CONF_ASSISTANT_NAME]
-    global_date_fmt = conf[CONF_DATE_FORMAT]
-    global_include_time = conf[CONF_INCLUDE_TIME]
-    
-    time_slots_conf = conf.get(CONF_TIME_SLOTS, DEFAULT_TIME_SLOTS)
-    dnd_conf = conf.get(CONF_DND, DEFAULT_DND)
-    base_greetings = conf.get(CONF_GREETINGS, DEFAULT_GREETINGS)
 
-    async def async_send_notification(call: ServiceCall):
-        """Handler principale del servizio 'send'."""
-        
+    def circuit_changed(breaker: CircuitBreaker):
+        """Espone i cambi di stato del circuito come evento."""
+        hass.bus.async_fire(EVENT_CIRCUIT_CHANGED, {"channel": breaker.channel, **breaker.as_dict()})
+
+    # Configurazione compilata una sola volta: piano di instradamento (servizi,
+    # player, parse_mode), indice dei target, fasce orarie, circuit breaker e
+    # rate limit. Il servizio 'reload' la sostituisce senza riavviare HA.
+    try:
+        state = NotifierState(hass, conf, on_circuit_change=circuit_changed)
+    except vol.Invalid as err:
+        _LOGGER.error("UniNotifier: Configurazione canali non valida: %s", err)
+        return False
+
+    # Volume noto dei player dei canali vocali (evita volume_set inutili)
+    state.volume_cache.async_start()
+
+    # Code di consegna per player/canale (priorità in testa alla coda)
+    scheduler = DeliveryScheduler(
+        hass, conf.get(CONF_PRIORITY_PREEMPT, DEFAULT_PRIORITY_PREEMPT)
+    )
+
+    # Messaggi già inviati, per la deduplica
+    dedup_cache = DedupCache()
+    # Target sconosciuti già segnalati (un solo warning per nome, i più vecchi dimenticati)
+    reported_unknown = {}
+
+    # Metriche solo se richieste: da disattivate costano un controllo 'is None'
+    metrics = DeliveryMetrics() if conf.get(CONF_METRICS, DEFAULT_METRICS) else None
+
+    hass.data[DOMAIN] = {"scheduler": scheduler, "breakers": state.breakers, "metrics": metrics}
+
+    # Canali che hanno già un sensore di latenza (il reload aggiunge i nuovi)
+    sensor_channels = set(state.routing_table)
+    if metrics is not None:
+        hass.async_create_task(discovery.async_load_platform(
+            hass, "sensor", DOMAIN, {"channels": list(state.routing_table), "call": True}, config
+        ))
+
+    async def async_flush_dnd(channel: str, items: list):
+        """A fine DND rimanda i messaggi trattenuti attraverso il servizio 'send'."""
+        for item in items:
+            data = {
+                CONF_MESSAGE: item[CONF_MESSAGE], CONF_TARGETS: [channel],
+                CONF_DEDUP_WINDOW: 0, CONF_WAIT: False,
+            }
+            if item.get(CONF_TITLE):
+                data[CONF_TITLE] = item[CONF_TITLE]
+            if item.get(CONF_TYPE):
+                data[CONF_DATA] = {CONF_TYPE: item[CONF_TYPE]}
+            await hass.services.async_call(DOMAIN, SERVICE_SEND, data)
+
+    # Messaggi vocali trattenuti durante il DND (persistenti tra i riavvii)
+    dnd_buffer = DndBuffer(hass, async_flush_dnd)
+    await dnd_buffer.async_load()
+
+    @callback
+    def async_schedule_dnd_flush(_hass: HomeAssistant):
+        """Ad avvio completato consegna i messaggi rimasti (a fine DND se ancora attivo)."""
+        now = dt_util.now()
+        schedule = state.schedule
+        dnd_buffer.schedule(schedule.next_dnd_end(now) if schedule.resolve(now)[2] else now)
+
+    if len(dnd_buffer):
+        async_at_started(hass, async_schedule_dnd_flush)
+
+    # Ripristini del volume in attesa: player -> (job, attesa della riproduzione, livello)
+    pending_restores = {}
+
+    @callback
+    def async_restore_done(player: str, job: DeliveryJob, _done: asyncio.Future):
+        if player in pending_restores and pending_restores[player][0] is job:
+            del pending_restores[player]
+
+    # Registro delle consegne dei canali con 'journal_ttl' (almeno una volta)
+    journal = DeliveryJournal(hass)
+    await journal.async_load()
+
+    @callback
+    def async_journal_done(entry_id: int, done: asyncio.Future):
+        if not done.cancelled():
+            journal.finish(entry_id, done.result().status)
+
+    async def async_replay_journal(_hass: HomeAssistant):
+        """Ad avvio completato ripete le consegne rimaste in sospeso e non scadute."""
+        for entry in journal.take_pending():
+            _LOGGER.info("UniNotifier: Ripeto la consegna in sospeso per '%s'", entry["c"])
+            data = {
+                CONF_MESSAGE: entry["m"], CONF_TARGETS: [entry["c"]],
+                CONF_DEDUP_WINDOW: 0, CONF_WAIT: False,
+            }
+            if entry.get("t"):
+                data[CONF_TITLE] = entry["t"]
+            extra = dict(entry.get("d") or {})
+            if entry.get("y"):
+                extra[CONF_TYPE] = entry["y"]
+            if extra:
+                data[CONF_DATA] = extra
+            if entry.get("p"):
+                data[CONF_PRIORITY] = True
+            try:
+                # Direttamente, non via servizio: riusa l'elemento (e la scadenza) originale
+                await async_send(SEND_SERVICE_SCHEMA(data), Context(), replay_entry=entry["id"])
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error("UniNotifier: Ripetizione per '%s' fallita: %s", entry["c"], err)
+
+    if len(journal):
+        async_at_started(hass, async_replay_journal)
+
+    async def async_shutdown():
+        """Allo stop di HA svuota le code (entro un timeout) e chiude i worker."""
+        dnd_buffer.cancel()
+        state.volume_cache.async_stop()
+        await scheduler.async_shutdown(SHUTDOWN_DRAIN_TIMEOUT)
+
+    # Job di shutdown: girano prima che HA annulli i task in background (i worker)
+    hass.async_add_shutdown_job(HassJob(async_shutdown))
+
+    async def async_send(
+        data: dict, context: Context, return_response: bool = False, replay_entry: int = None,
+    ) -> ServiceResponse:
+        """Logica del servizio 'send' (dati già validati da SEND_SERVICE_SCHEMA).
+
+        Se l'automazione chiede la risposta, attende sempre le consegne e
+        restituisce l'esito di ogni target. 'replay_entry' è l'elemento del
+        registro ripetuto all'avvio: non è un campo del servizio, così
+        nessuna automazione può chiudere elementi del registro.
+        """
+        # Istantanea della configurazione: un reload non la cambia a metà chiamata
+        current = state
+        conf = current.conf
+        routing_table, target_index = current.routing_table, current.target_index
+        schedule, base_greetings = current.schedule, current.greetings
+        breakers, buckets, volume_cache = current.breakers, current.buckets, current.volume_cache
+
+        global_name = conf[CONF_ASSISTANT_NAME]
+        global_date_fmt = conf[CONF_DATE_FORMAT]
+        global_include_time = conf[CONF_INCLUDE_TIME]
+        global_wait = conf.get(CONF_WAIT, DEFAULT_WAIT)
+        global_dedup_window = conf.get(CONF_DEDUP_WINDOW, DEFAULT_DEDUP_WINDOW)
+        coalesce = conf.get(CONF_COALESCE, DEFAULT_COALESCE)
+        global_restore_volume = conf.get(CONF_RESTORE_VOLUME, DEFAULT_RESTORE_VOLUME)
+        delivered_event = conf.get(CONF_DELIVERED_EVENT, DEFAULT_DELIVERED_EVENT)
+
         # 1. Parsing Input
-        global_raw_message = call.data.get(CONF_MESSAGE, "")
-        global_title = call.data.get(CONF_TITLE) # Titolo originale
-        runtime_data = call.data.get(CONF_DATA, {})
-        target_specific_data = call.data.get(CONF_TARGET_DATA, {})
-        targets = call.data.get(CONF_TARGETS, [])
+        global_raw_message = data.get(CONF_MESSAGE, "")
+        global_title = data.get(CONF_TITLE) # Titolo originale
+        runtime_data = data.get(CONF_DATA, {})
+        target_specific_data = data.get(CONF_TARGET_DATA, {})
+        targets = data.get(CONF_TARGETS, [])
         
-        override_name = call.data.get(CONF_ASSISTANT_NAME, global_name)
-        skip_greeting = call.data.get(CONF_SKIP_GREETING, False)
-        include_time = call.data.get(CONF_INCLUDE_TIME, global_include_time)
-        is_priority = call.data.get(CONF_PRIORITY, False)
+        override_name = data.get(CONF_ASSISTANT_NAME, global_name)
+        skip_greeting = data.get(CONF_SKIP_GREETING, False)
+        include_time = data.get(CONF_INCLUDE_TIME, global_include_time)
+        is_priority = data.get(CONF_PRIORITY, False)
+        wait = data.get(CONF_WAIT, global_wait) or return_response
+        dedup_window = data.get(CONF_DEDUP_WINDOW, global_dedup_window)
+        restore_volume = data.get(CONF_RESTORE_VOLUME, global_restore_volume)
         
         global_bold_setting = conf.get(CONF_BOLD_PREFIX, DEFAULT_BOLD_PREFIX)
-        use_bold_prefix = call.data.get(CONF_BOLD_PREFIX, global_bold_setting)
+        use_bold_prefix = data.get(CONF_BOLD_PREFIX, global_bold_setting)
 
         # 2. Analisi Contesto
+        stage_start = time.perf_counter() if metrics is not None else None
         now = dt_util.now()
-        now_time = now.time()
-        
-        slot_key, slot_volume = get_current_slot_info(time_slots_conf, now_time)
-        is_dnd_active = is_time_in_range(dnd_conf["start"], dnd_conf["end"], now_time)
+        slot_key, slot_volume, is_dnd_active = schedule.resolve(now)
         
         # 3. Gestione Saluti
-        override_greetings_data = call.data.get(CONF_OVERRIDE_GREETINGS)
+        override_greetings_data = data.get(CONF_OVERRIDE_GREETINGS)
         effective_greetings = base_greetings
         if override_greetings_data:
             effective_greetings = base_greetings.copy() 
@@ -223,53 +488,63 @@ async def async_setup(hass: HomeAssistant, config: dict):
         # Dati base per prefissi
         raw_name = override_name
         raw_time_str = now.strftime(global_date_fmt) if include_time else ""
+        if stage_start is not None:
+            metrics.record(METRICS_CALL, STAGE_CONTEXT, time.perf_counter() - stage_start)
 
         if isinstance(targets, str): targets = [targets]
-        tasks = [] # Lista per asyncio.gather
+        jobs = []          # Consegne da accodare, una per target
+        journal_ids = []   # Id nel registro delle consegne (None se il canale non lo usa)
+        volume_levels = {} # Player -> volume da impostare prima della voce
+        renders = {}       # (voce, parse_mode, messaggio) -> (messaggio, titolo)
+        results = []    # Esiti immediati (target sconosciuti, DND)
 
         # ======================================================================
         # 4. CICLO SUI CANALI
         # ======================================================================
-        for target_alias in targets:
-            if target_alias not in channels_config:
-                _LOGGER.info(f"UniNotifier: Target '{target_alias}' sconosciuto.")
+        # Alias, gruppi, tag e glob -> canali, ognuno una sola volta
+        aliases, unknown = target_index.resolve(targets)
+        for name in unknown:
+            if name not in reported_unknown:
+                if len(reported_unknown) >= UNKNOWN_TARGETS_SIZE:
+                    reported_unknown.pop(next(iter(reported_unknown)))
+                reported_unknown[name] = None
+                _LOGGER.warning("UniNotifier: Target '%s' sconosciuto (non è un canale, un gruppo o un tag)", name)
+            results.append(DeliveryResult(name, STATUS_UNKNOWN))
+
+        for target_alias in aliases:
+            route = routing_table[target_alias]
+            _LOGGER.debug("UniNotifier: Channel Route %s", route)
+
+            # Circuito aperto: il canale non costa nulla finché non scade il cooldown.
+            # La prova in half_open si consuma solo quando il job viene creato.
+            breaker = breakers.get(target_alias)
+            if breaker is not None and not breaker.ready():
+                _LOGGER.info("UniNotifier: Skipped '%s' (circuito aperto)", target_alias)
+                results.append(DeliveryResult(target_alias, STATUS_CIRCUIT_OPEN, route.default.service))
                 continue
-
-            channel_conf = channels_config[target_alias]
-            _LOGGER.debug(f"UniNotifier: Channel Configuration {channel_conf }")
             
             # A. Preparazione Dati Specifici
             specific_data = {}
             if target_alias in target_specific_data:
                 specific_data = target_specific_data[target_alias].copy()
-            _LOGGER.debug(f"UniNotifier: Specific Data {specific_data}")
+            _LOGGER.debug("UniNotifier: Specific Data %s", specific_data)
 
             target_raw_message = specific_data.pop(CONF_MESSAGE, global_raw_message)
             
-            # B. Selezione Servizio
+            # B. Selezione Servizio (variante pre-compilata)
             service_type = specific_data.pop(CONF_TYPE, runtime_data.get(CONF_TYPE, None))
-            alt_services_conf = channel_conf.get(CONF_ALT_SERVICES, {})
-            _LOGGER.debug(f"UniNotifier: Service type {service_type}")
-            _LOGGER.debug(f"UniNotifier: Service alt {alt_services_conf}")
-            
-            if service_type and service_type in alt_services_conf:
-                target_service_conf = alt_services_conf[service_type]
-                full_service_name = target_service_conf[CONF_SERVICE]
-                base_service_payload = target_service_conf.get(CONF_SERVICE_DATA, {}) or {}
-                is_voice_channel = False 
-            else:
-                full_service_name = channel_conf[CONF_SERVICE]
-                base_service_payload = channel_conf.get(CONF_SERVICE_DATA, {}) or {}
-                is_voice_channel = channel_conf[CONF_IS_VOICE]
-
-            _LOGGER.debug(f"UniNotifier: Full Service Name {full_service_name}")
-            _LOGGER.debug(f"UniNotifier: Base Service Payload {base_service_payload}")
-
-            # Estrai domini per controlli successivi
-            try:
-                srv_domain, srv_name = full_service_name.split(".", 1)
-            except ValueError:
-                _LOGGER.error(f"UniNotifier: Servizio non valido {full_service_name}")
+            variant = route.variant(service_type)
+            srv_domain, srv_name = variant.domain, variant.name
+            is_voice_channel = variant.is_voice
+            _LOGGER.debug("UniNotifier: Service type %s -> %s", service_type, variant)
+
+            # Deduplica: stesso messaggio/titolo/tipo verso lo stesso target nella finestra
+            if dedup_window and dedup_cache.seen(
+                dedup_key(target_raw_message, global_title, target_alias, service_type),
+                dedup_window,
+            ):
+                _LOGGER.info("UniNotifier: Skipped '%s' (duplicato entro %ss)", target_alias, dedup_window)
+                results.append(DeliveryResult(target_alias, STATUS_DUPLICATE, variant.service))
                 continue
 
             # C. Check Comandi
@@ -278,73 +553,29 @@ async def async_setup(hass: HomeAssistant, config: dict):
                 is_command_message = True
 
             # D. COSTRUZIONE MESSAGGIO E TITOLO
-            parse_mode = specific_data.get("parse_mode", runtime_data.get("parse_mode"))
-            if not parse_mode and srv_domain == "telegram_bot":
-                parse_mode = "html"
+            stage_start = time.perf_counter() if metrics is not None else None
+            parse_mode = specific_data.get("parse_mode", runtime_data.get("parse_mode")) or variant.parse_mode
 
-            final_msg = ""
-            final_title = global_title # Start col titolo originale
-            
+            # Ogni variante (voce/visuale, parse_mode, messaggio) è costruita una
+            # sola volta per chiamata e condivisa tra i target che la usano
             if is_command_message:
-                final_msg = target_raw_message
+                final_msg, final_title = target_raw_message, global_title
             else:
-                # --- LOGICA 1: CANALI VOCALI (TTS) ---
-                if is_voice_channel:
-                    # 1. Pulizia testo per TTS
-                    clean_msg = clean_text_for_tts(str(target_raw_message))
-                    clean_greet = clean_text_for_tts(current_greeting)
-                    # 2. Incorporazione del TITOLO nel messaggio vocale
-                    full_spoken_text = ""
-                    
-                    if final_title:
-                        clean_title = clean_text_for_tts(final_title)
-                        if clean_title:
-                            full_spoken_text += f"{clean_title}. "
-                    
-                    if clean_greet:
-                        full_spoken_text += f"{clean_greet}. "
-                    
-                    full_spoken_text += clean_msg
-                    
-                    final_msg = full_spoken_text
-                    
-                    # 3. Rimuoviamo il titolo dal payload finale per evitare errori TTS
-                    final_title = None 
-
-                # --- LOGICA 2: CANALI VISUALI ---
-                else:
-                    # 1. Sanitizzazione base
-                    clean_name = sanitize_text_visual(raw_name, parse_mode)
-                    clean_time = sanitize_text_visual(raw_time_str, parse_mode)
-                    clean_msg = sanitize_text_visual(str(target_raw_message), parse_mode)
-                    clean_greet = sanitize_text_visual(current_greeting, parse_mode)
-                    # Sanitizza anche il titolo originale se presente
-                    clean_orig_title = sanitize_text_visual(final_title, parse_mode) if final_title else None
-
-                    # 2. Bolding
-                    if use_bold_prefix:
-                        clean_name = apply_formatting(clean_name, parse_mode, "bold")
-                        clean_time = apply_formatting(clean_time, parse_mode, "bold")
-
-                    # 3. Costruzione stringa Prefisso
-                    # Formato: [Nome - 12:00]
-                    prefix_content = clean_name
-                    if clean_time:
-                        prefix_content += f" - {clean_time}"
-                    clean_prefix = f"[{prefix_content}]" # Nota: niente spazio finale qui, lo gestiamo dopo
-
-                    # 4. Distribuzione Prefisso (Richiesta 2)
-                    greeting_part = f"{clean_greet}. " if clean_greet else ""
-                    
-                    if clean_orig_title:
-                        # CASO A: Esiste un titolo -> Prefisso va nel Titolo
-                        final_title = f"{clean_prefix} {clean_orig_title}"
-                        final_msg = f"{greeting_part}{clean_msg}"
+                raw_text = str(target_raw_message)
+                # Il testo parlato non dipende dal parse_mode
+                render_key = (is_voice_channel, None if is_voice_channel else parse_mode, raw_text)
+                rendered = renders.get(render_key)
+                if rendered is None:
+                    if is_voice_channel:
+                        rendered = render_voice(raw_text, global_title, current_greeting)
                     else:
-                        # CASO B: Niente titolo -> Prefisso va nel Messaggio
-                        # (clean_prefix + spazio + saluti + messaggio)
-                        final_msg = f"{clean_prefix} {greeting_part}{clean_msg}"
-                        
+                        rendered = render_visual(
+                            raw_text, global_title, current_greeting,
+                            raw_name, raw_time_str, parse_mode, use_bold_prefix,
+                        )
+                    renders[render_key] = rendered
+                final_msg, final_title = rendered
+
             ####################################################################
             # E. Determinazione del Volume
             override_volume = specific_data.get("volume", runtime_data.get("volume"))
@@ -356,41 +587,35 @@ async def async_setup(hass: HomeAssistant, config: dict):
             else:
                 target_volume = slot_volume
 
-            # F. IDENTIFICAZIONE DEI PLAYER FISICI (Per Volume e Invio)
-            # 1. Cerca in tts (media_player_entity_id standard)
-            tts_players = base_service_payload.get("media_player_entity_id", [])
-            if isinstance(tts_players, str): tts_players = [tts_players]
-            
-            # 2. Cerca in notify/alexa (target nel config del canale)
-            notify_targets = channel_conf.get(CONF_TARGET, [])
-            if isinstance(notify_targets, str): notify_targets = [notify_targets]
-            
-            _LOGGER.debug(f"UniNotifier: MediaPlayer o ChatId o tts target {notify_targets}")
-
-            # 3. Lista unificata dei player a cui impostare il volume
-            media_players_targets = []
-            if tts_players:
-                media_players_targets.extend(tts_players)
-            if notify_targets and is_voice_channel:
-                media_players_targets.extend(notify_targets)
+            # F. Player fisici a cui impostare il volume (risolti in fase di setup)
+            media_players_targets = list(variant.media_players)
 
             # G. Applicazione Volume e Check DND (Solo Canali Voce)
+            steps = []
             if is_voice_channel:
                 if is_dnd_active and not is_priority and override_volume is None:
-                    _LOGGER.info(f"UniNotifier: Skipped '{target_alias}' (DND attivo)")
+                    if route.dnd_policy == DND_DROP:
+                        _LOGGER.info("UniNotifier: Skipped '%s' (DND attivo)", target_alias)
+                        results.append(DeliveryResult(target_alias, STATUS_SKIPPED_DND, variant.service))
+                        continue
+                    # defer/digest: trattenuto e consegnato da un unico timer a fine DND
+                    _LOGGER.info("UniNotifier: '%s' rimandato a fine DND (%s)", target_alias, route.dnd_policy)
+                    dnd_buffer.add(target_alias, route.dnd_policy, target_raw_message, global_title, service_type)
+                    dnd_buffer.schedule(schedule.next_dnd_end(now))
+                    results.append(DeliveryResult(target_alias, STATUS_DEFERRED, variant.service))
                     continue
                 
-                _LOGGER.debug(f"UniNotifier: MediaPlayer {media_players_targets} - Volume {target_volume}")
+                _LOGGER.debug("UniNotifier: MediaPlayer %s - Volume %s", media_players_targets, target_volume)
                 
                 # Imposta volume se abbiamo player identificati
-                if media_players_targets:
-                    tasks.append(hass.services.async_call(
-                        "media_player", "volume_set", 
-                        {"entity_id": media_players_targets, "volume_level": target_volume}
-                    ))
+                # Volume raccolto per player: un solo volume_set per livello, a fine ciclo.
+                # Player condiviso da più canali con livelli diversi: vince il più alto.
+                for player in media_players_targets:
+                    if target_volume > volume_levels.get(player, -1):
+                        volume_levels[player] = target_volume
 
             # F. Costruzione Payload Finale
-            service_payload = base_service_payload.copy()
+            service_payload = dict(variant.service_data)
 
             # Mapping Messaggio
             if srv_domain == "telegram_bot":
@@ -408,10 +633,8 @@ async def async_setup(hass: HomeAssistant, config: dict):
             # I. Routing dei Target nel Payload
             # Caso 1: TTS usa 'media_player_entity_id' già presente nei dati base.
             # Caso 2: Provider TTS (es. google_translate)
-            if srv_domain == "tts" and CONF_TARGET in channel_conf:
-                provider_entity = channel_conf.get(CONF_TARGET)
-                if provider_entity:
-                    service_payload[ATTR_ENTITY_ID] = provider_entity
+            if variant.provider_entity:
+                service_payload[ATTR_ENTITY_ID] = variant.provider_entity
             
             # J. Merge Dati Accessori (alexa type, telegram images, etc.)
             all_additional_data = {}
@@ -424,8 +647,8 @@ async def async_setup(hass: HomeAssistant, config: dict):
             if all_additional_data:
                 if srv_domain == "notify":
                     # Per Alexa e Mobile App i dati vanno in "data"
-                    if "data" not in service_payload: service_payload["data"] = {}
-                    service_payload["data"].update(all_additional_data)
+                    # Copia: il "data" di service_data appartiene alla config
+                    service_payload["data"] = {**service_payload.get("data", {}), **all_additional_data}
                 else:
                     # Per altri servizi, merge diretto
                     service_payload.update(all_additional_data)
@@ -436,22 +659,263 @@ async def async_setup(hass: HomeAssistant, config: dict):
             #     final_payload[CONF_ENTITY_ID] = channel_conf[CONF_TARGET]
 
             # H. SEND 
+            fanout = False
+            text_limit = None
+            chunked = False
             if srv_domain == "telegram_bot":
-                p = service_payload.copy()
-                p[CONF_TARGET] = str(notify_targets[0]) # Telegram vuole 'target' per il chat_id
-                _LOGGER.debug(f"UniNotifier: Final payload {p} - Service data {srv_domain}/{srv_name}")
-                tasks.append(hass.services.async_call(srv_domain, srv_name, p))
+                # Testo oltre i limiti di Telegram: più messaggi, tagliati su paragrafi/frasi
+                text_field = "caption" if "caption" in service_payload else "message"
+                text_limit = TELEGRAM_CAPTION_LIMIT if text_field == "caption" else TELEGRAM_TEXT_LIMIT
+                # send_message invia "titolo\nmessaggio": il titolo occupa spazio nella prima parte
+                title = service_payload.get("title") if text_field == "message" else None
+                chunks = split_formatted(
+                    str(service_payload[text_field]), text_limit, service_payload.get("parse_mode"),
+                    reserved=len(title) + 1 if title else 0,
+                )
+                chunked = len(chunks) > 1
+                sends = [(srv_name, {**service_payload, text_field: chunks[0]})]
+                for chunk in chunks[1:]:
+                    if text_field == "caption":
+                        # Il resto della didascalia segue come messaggio di testo
+                        follow_up = {"message": chunk}
+                        if "parse_mode" in service_payload:
+                            follow_up["parse_mode"] = service_payload["parse_mode"]
+                    else:
+                        # Il titolo solo nella prima parte
+                        follow_up = {key: value for key, value in service_payload.items() if key != "title"}
+                        follow_up["message"] = chunk
+                    sends.append(("send_message", follow_up))
+
+                if route.fanout == FANOUT_PER_CHAT and len(route.chat_ids) > 1:
+                    # Una catena di chiamate per chat: l'esito di ognuna finisce nei dettagli
+                    fanout = True
+                    for chat_id in route.chat_ids:
+                        for name, p in sends:
+                            steps.append(ServiceStep(srv_domain, name, {**p, CONF_TARGET: chat_id}, label=str(chat_id)))
+                else:
+                    for name, p in sends:
+                        if route.chat_ids:
+                            # Telegram vuole 'target' per i chat_id (senza usa la chat di default del bot)
+                            p[CONF_TARGET] = list(route.chat_ids)
+                        steps.append(ServiceStep(srv_domain, name, p))
+                _LOGGER.debug("UniNotifier: Final payload %s - Service data %s/%s (%s parti)", service_payload, srv_domain, srv_name, len(chunks))
+            elif is_voice_channel and route.split_sentences and media_players_targets and not is_command_message:
+                # Una frase alla volta: l'audio parte dopo la sintesi della prima,
+                # le successive attendono la fine della riproduzione sui player
+                sentences = split_sentences(final_msg)
+                chunked = len(sentences) > 1
+                for idx, sentence in enumerate(sentences):
+                    if idx:
+                        # Al massimo la durata stimata della frase precedente: un
+                        # player sempre in 'playing' (es. musica) non blocca la lane
+                        steps.append(WaitStep("fine frase", partial(
+                            async_wait_playback, hass, media_players_targets, PLAYBACK_START_TIMEOUT,
+                            PLAYBACK_START_TIMEOUT + len(sentences[idx - 1]) / SPEECH_CHARS_PER_SECOND,
+                        )))
+                    steps.append(ServiceStep(srv_domain, srv_name, {**service_payload, "message": sentence}))
+                _LOGGER.debug("UniNotifier: Final payload %s - Service data %s/%s (%s frasi)", service_payload, srv_domain, srv_name, len(sentences))
             else:
                 # Chiamata Standard (TTS, Alexa, Notify)
-                _LOGGER.debug(f"UniNotifier: Final payload {service_payload} - Service data {srv_domain}/{srv_name}")
-                tasks.append(hass.services.async_call(srv_domain, srv_name, service_payload))
-
-        # Esecuzione parallela di tutti i task (volumi e notifiche)
-        if tasks:
-            await asyncio.gather(*tasks)
+                _LOGGER.debug("UniNotifier: Final payload %s - Service data %s/%s", service_payload, srv_domain, srv_name)
+                steps.append(ServiceStep(srv_domain, srv_name, service_payload))
+
+            if stage_start is not None:
+                metrics.record(target_alias, STAGE_RENDER, time.perf_counter() - stage_start)
+
+            if breaker is not None:
+                # Consegna confermata: ora consuma la prova in half_open (ready() già
+                # verificato e nessun await nel ciclo, quindi passa sempre)
+                breaker.allow()
+
+            # Serializzazione sui player fisici coinvolti (o sul canale stesso)
+            lanes = media_players_targets if is_voice_channel else ()
+            jobs.append(DeliveryJob(
+                target_alias, variant.service, steps,
+                lanes or (channel_lane(target_alias),),
+                context, is_priority, route.timeout, route.retry, breaker,
+                buckets.get(target_alias),
+                # I comandi Companion e i messaggi già divisi in parti non si accorpano
+                merge_sep=None if is_command_message or chunked else (" " if is_voice_channel else "\n"),
+                parallel=fanout, text_limit=text_limit,
+                volume=target_volume if is_voice_channel else None,
+            ))
+            if replay_entry is not None:
+                # Ripetizione dopo un riavvio: l'esito chiude l'elemento originale
+                journal_ids.append(replay_entry)
+            else:
+                journal_ids.append(journal.add(
+                    target_alias, target_raw_message, global_title, service_type,
+                    {key: value for key, value in {**runtime_data, **specific_data}.items() if key != CONF_TYPE},
+                    is_priority, route.journal_ttl,
+                ) if route.journal_ttl else None)
+
+        if replay_entry is not None and not jobs:
+            # Ripetizione senza consegna (rimandata a fine DND, circuito aperto,
+            # canale rimosso...): l'elemento si chiude qui e non viene più ripetuto
+            journal.finish(replay_entry, results[0].status if results else STATUS_UNKNOWN)
+
+        # K. Volume: un solo volume_set per livello distinto tra i player liberi,
+        # uno per player su quelli occupati (un player occupato non ritarda gli
+        # altri); ogni consegna vocale attende solo i volume_set dei suoi player.
+        # I player già al livello richiesto vengono saltati: conta anche un
+        # volume_set o un ripristino ancora in coda.
+        volume_changes = {
+            player: level for player, level in volume_levels.items()
+            if volume_cache.differs(player, level)
+        }
+        # Livelli da ripristinare: quelli attesi prima di questa chiamata
+        previous_levels = {
+            player: volume_cache.get(player) for player in volume_changes
+            if volume_cache.get(player) is not None
+        } if restore_volume else {}
+        if volume_changes:
+            _LOGGER.debug("UniNotifier: Volume %s", volume_changes)
+
+        @callback
+        def async_volume_done(done: asyncio.Future):
+            if not done.cancelled() and done.result().elapsed is not None:
+                metrics.record(METRICS_CALL, STAGE_VOLUME, done.result().elapsed)
+
+        batches = []  # ([player], livello)
+        idle_levels = {}  # livello -> player con la lane libera
+        for player, level in volume_changes.items():
+            if scheduler.is_idle(player):
+                idle_levels.setdefault(level, []).append(player)
+            else:
+                batches.append(([player], level))
+        batches.extend((players, level) for level, players in idle_levels.items())
+
+        volume_jobs = {}  # player -> future del suo volume_set
+        for players, level in batches:
+            volume_done = scheduler.submit(DeliveryJob(
+                "volume_set", "media_player.volume_set",
+                [volume_step(players[0] if len(players) == 1 else players, level)], players,
+                context, is_priority, preemptible=False,
+            ), detached=True)
+            if metrics is not None:
+                volume_done.add_done_callback(async_volume_done)
+            for player in players:
+                volume_jobs[player] = volume_done
+                volume_cache.async_track_pending(player, level, volume_done)
+
+        deliveries = [
+            scheduler.submit(
+                job, detached=not wait, coalesce_window=dedup_window if coalesce else 0,
+                after=wait_all([volume_jobs[lane] for lane in job.lanes if lane in volume_jobs]),
+            )
+            for job in jobs
+        ]
+        for entry_id, delivery in zip(journal_ids, deliveries):
+            if entry_id is not None:
+                delivery.add_done_callback(partial(async_journal_done, entry_id))
+
+        # L. Ripristino del volume precedente di ogni player, a riproduzione conclusa.
+        # Un ripristino ancora in attesa su un player di questa chiamata viene
+        # assorbito: stesso livello, ma dopo i nuovi annunci.
+        restore_levels = dict(previous_levels)
+        for player in volume_changes:
+            absorbed = pending_restores.pop(player, None)
+            if absorbed is not None and scheduler.cancel(absorbed[0], "Assorbito da un nuovo annuncio"):
+                absorbed[1].cancel()
+                restore_levels.setdefault(player, absorbed[2])
+
+        for player, level in restore_levels.items():
+            spoken = [
+                delivery for job, delivery in zip(jobs, deliveries) if player in job.lanes
+            ]
+            # L'attesa della riproduzione è la dipendenza del job, fuori dalla
+            # lane: gli annunci (prioritari e non) sul player non restano bloccati
+            waiter = hass.async_create_background_task(
+                async_wait_spoken(hass, spoken, (player,), PLAYBACK_START_TIMEOUT, PLAYBACK_MAX_WAIT),
+                f"universal_notifier restore {player}",
+            )
+            restore_job = DeliveryJob(
+                "volume_restore", "media_player.volume_set", [volume_step(player, level)],
+                # Il ripristino non va mai perso: il player resterebbe al volume dell'annuncio
+                (player,), context, is_priority, preemptible=False,
+            )
+            restore_done = scheduler.submit(restore_job, detached=True, after=waiter)
+            pending_restores[player] = (restore_job, waiter, level)
+            restore_done.add_done_callback(partial(async_restore_done, player, restore_job))
+            volume_cache.async_track_pending(player, level, restore_done)
+
+        # Esiti verso metriche ed evento, man mano che le consegne terminano
+        if metrics is not None or delivered_event:
+            @callback
+            def async_report(result: DeliveryResult):
+                if metrics is not None:
+                    metrics.record_result(result)
+                if delivered_event:
+                    hass.bus.async_fire(EVENT_DELIVERED, result.as_dict(), context=context)
+
+            for result in results:
+                async_report(result)
+            for delivery in deliveries:
+                delivery.add_done_callback(
+                    lambda done: done.cancelled() or async_report(done.result())
+                )
+            if metrics is not None:
+                metrics.async_notify(METRICS_CALL)
+
+        # Player diversi in parallelo, stesso player in sequenza.
+        # Con wait: false le consegne proseguono in background.
+        if deliveries and wait:
+            # Ogni consegna ha il suo esito: un canale in errore non blocca gli altri
+            results.extend(await asyncio.gather(*deliveries))
+            for result in results:
+                if result.error:
+                    _LOGGER.warning("UniNotifier: '%s' %s: %s", result.target, result.status, result.error)
+        _LOGGER.debug("UniNotifier: Esiti %s", results)
+
+        if return_response:
+            return {"targets": {result.target: result.as_dict() for result in results}}
+        return None
+
+    async def async_send_notification(call: ServiceCall) -> ServiceResponse:
+        """Handler del servizio 'send'."""
+        return await async_send(call.data, call.context, call.return_response)
+
+    async def async_reload(call: ServiceCall):
+        """Rilegge configuration.yaml e sostituisce l'istantanea compilata."""
+        nonlocal state
+        new_config = await async_integration_yaml_config(hass, DOMAIN)
+        if not new_config or DOMAIN not in new_config:
+            # Errori di validazione già registrati da Home Assistant
+            raise HomeAssistantError("UniNotifier: configurazione non trovata o non valida, reload annullato")
+        new_conf = new_config[DOMAIN]
+        try:
+            new_state = NotifierState(hass, new_conf, state, circuit_changed)
+        except vol.Invalid as err:
+            raise HomeAssistantError(f"UniNotifier: Configurazione canali non valida: {err}") from err
+
+        old_state, state = state, new_state
+        if new_state.volume_cache is not old_state.volume_cache:
+            old_state.volume_cache.async_stop()
+            new_state.volume_cache.async_start()
+        scheduler.preempt = new_conf.get(CONF_PRIORITY_PREEMPT, DEFAULT_PRIORITY_PREEMPT)
+        hass.data[DOMAIN]["breakers"] = new_state.breakers
+        reported_unknown.clear()
+
+        # Messaggi DND in attesa: nuovo orario di consegna secondo il nuovo DND
+        dnd_buffer.cancel()
+        if len(dnd_buffer):
+            async_schedule_dnd_flush(hass)
+        if metrics is None and new_conf.get(CONF_METRICS, DEFAULT_METRICS):
+            _LOGGER.warning("UniNotifier: 'metrics' si attiva solo al riavvio di Home Assistant")
+        if metrics is not None:
+            # Sensori per i canali nuovi; quelli dei canali rimossi restano fino al riavvio
+            added = [alias for alias in new_state.routing_table if alias not in sensor_channels]
+            if added:
+                sensor_channels.update(added)
+                hass.async_create_task(discovery.async_load_platform(
+                    hass, "sensor", DOMAIN, {"channels": added, "call": False}, config
+                ))
+        _LOGGER.info("UniNotifier: Configurazione ricaricata (%d canali)", len(new_state.routing_table))
 
     hass.services.async_register(
-        DOMAIN, "send", async_send_notification, schema=SEND_SERVICE_SCHEMA
+        DOMAIN, SERVICE_SEND, async_send_notification, schema=SEND_SERVICE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
     )
+    async_register_admin_service(hass, DOMAIN, SERVICE_RELOAD, async_reload)
     
     return True
@@ -0,0 +1,157 @@
+# /config/custom_components/universal_notifier/chunking.py
+
+"""Suddivisione dei testi lunghi: limiti di Telegram e frasi per il TTS."""
+
+import re
+
+from .const import TTS_SENTENCE_MIN_LENGTH
+
+# Tag HTML (apertura o chiusura) ed entità incomplete a fine testo
+HTML_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+PARTIAL_ENTITY_RE = re.compile(r"&#?\w*$")
+# Fine frase: punteggiatura (con eventuali virgolette/parentesi) seguita da spazi
+SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'»)\]]*\s+")
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+# Marcatori Markdown di Telegram, il più lungo per primo
+MARKDOWN_MARKERS = ("```", "`", "*", "_", "~")
+
+
+def _cut(text: str, budget: int, html: bool) -> int:
+    """Punto di taglio entro 'budget': paragrafo, riga, frase, parola o a forza.
+
+    Un taglio troppo vicino all'inizio (prima di metà budget) viene scartato
+    a favore del separatore successivo, per non produrre pezzi minuscoli.
+    """
+    window = text[:budget]
+    half = budget // 2
+    cut = None
+    for sep in ("\n\n", "\n"):
+        pos = window.rfind(sep)
+        if pos > half:
+            cut = pos + len(sep)
+            break
+    if cut is None:
+        ends = [match.end() for match in SENTENCE_END_RE.finditer(window)]
+        if ends and ends[-1] > half:
+            cut = ends[-1]
+    if cut is None:
+        pos = window.rfind(" ")
+        cut = pos + 1 if pos > half else budget
+
+    if html:
+        # Mai dentro un tag o un'entità (&lt;)
+        lt = text.rfind("<", 0, cut)
+        if lt > text.rfind(">", 0, cut):
+            cut = lt
+        entity = PARTIAL_ENTITY_RE.search(text, 0, cut)
+        if entity:
+            cut = entity.start()
+    return cut if cut > 0 else budget
+
+
+def _track_html(open_tags: list, piece: str) -> list:
+    """Tag ancora aperti dopo 'piece': lista di (nome, tag di apertura)."""
+    open_tags = list(open_tags)
+    for match in HTML_TAG_RE.finditer(piece):
+        name = match.group(2).lower()
+        if not match.group(1):
+            open_tags.append((name, match.group(0)))
+            continue
+        for idx in range(len(open_tags) - 1, -1, -1):
+            if open_tags[idx][0] == name:
+                del open_tags[idx]
+                break
+    return open_tags
+
+
+def _track_markdown(open_markers: list, piece: str) -> list:
+    """Marcatori Markdown ancora aperti dopo 'piece' (dentro il codice valgono solo i suoi)."""
+    open_markers = list(open_markers)
+    idx = 0
+    while idx < len(piece):
+        if piece[idx] == "\\":
+            idx += 2
+            continue
+        code = open_markers[-1] if open_markers and open_markers[-1] in ("```", "`") else None
+        for marker in ((code,) if code else MARKDOWN_MARKERS):
+            if piece.startswith(marker, idx):
+                if marker in open_markers:
+                    open_markers.remove(marker)
+                else:
+                    open_markers.append(marker)
+                idx += len(marker)
+                break
+        else:
+            idx += 1
+    return open_markers
+
+
+def split_formatted(text: str, limit: int, parse_mode: str = None, reserved: int = 0) -> list:
+    """Divide 'text' in pezzi di al massimo 'limit' caratteri.
+
+    Con parse_mode HTML o Markdown i tag aperti al taglio vengono chiusi
+    alla fine del pezzo e riaperti all'inizio del successivo, così ogni
+    messaggio resta valido per Telegram. 'reserved' sono i caratteri già
+    occupati nel primo pezzo (es. il titolo che Telegram antepone al testo).
+    """
+    if reserved >= limit:
+        reserved = 0
+    if not text or len(text) <= limit - reserved:
+        return [text]
+
+    mode = (parse_mode or "").lower()
+    html = "html" in mode
+    if html:
+        track = _track_html
+        opening = lambda tags: "".join(tag for _, tag in tags)
+        closing = lambda tags: "".join(f"</{name}>" for name, _ in reversed(tags))
+    elif "markdown" in mode:
+        track = _track_markdown
+        opening = lambda markers: "".join(markers)
+        closing = lambda markers: "".join(reversed(markers))
+    else:
+        track = None
+
+    chunks = []
+    open_tags = []
+    rest = text
+    while rest:
+        room = limit if chunks else limit - reserved
+        prefix = opening(open_tags) if track else ""
+        if len(prefix) + len(rest) <= room:
+            chunks.append(prefix + rest)
+            break
+        budget = room - len(prefix)
+        while True:
+            if budget <= 0:
+                # Formattazione più lunga del limite: si taglia senza preservarla
+                track, prefix, open_tags, budget = None, "", [], room
+            cut = _cut(rest, budget, html)
+            piece = rest[:cut].rstrip()
+            still_open = track(open_tags, piece) if track else []
+            chunk = prefix + piece + (closing(still_open) if track else "")
+            if len(chunk) <= room:
+                break
+            budget -= len(chunk) - room
+        if piece:
+            chunks.append(chunk)
+        open_tags = still_open
+        rest = rest[cut:].lstrip()
+    return chunks
+
+
+def split_sentences(text: str, min_length: int = TTS_SENTENCE_MIN_LENGTH) -> list:
+    """Frasi da sintetizzare una alla volta; i frammenti corti si uniscono ai successivi."""
+    sentences = []
+    current = ""
+    for part in SENTENCE_SPLIT_RE.split(text or ""):
+        part = part.strip()
+        if not part:
+            continue
+        current = f"{current} {part}" if current else part
+        if len(current) >= min_length:
+            sentences.append(current)
+            current = ""
+    if current:
+        sentences.append(current)
+    return sentences or [text]
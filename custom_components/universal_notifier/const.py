@@ -1,6 +1,8 @@
 # /config/custom_components/universal_notifier/const.py
 
 DOMAIN = "universal_notifier"
+SERVICE_SEND = "send"
+SERVICE_RELOAD = "reload"
 
 # --- Chiavi di Configurazione (YAML) ---
 CONF_CHANNELS = "channels"
@@ -9,6 +11,7 @@ CONF_DATE_FORMAT = "date_format"
 CONF_GREETINGS = "greetings"
 CONF_TIME_SLOTS = "time_slots"
 CONF_DND = "dnd"
+CONF_PRIORITY_PREEMPT = "priority_preempt"
 
 # --- Chiavi Parametri Servizio (Service Call) ---
 # Usiamo queste costanti sia nello schema che nel codice
@@ -22,6 +25,13 @@ CONF_SKIP_GREETING = "skip_greeting"
 CONF_INCLUDE_TIME = "include_time"
 CONF_OVERRIDE_GREETINGS = "override_greetings"
 CONF_BOLD_PREFIX = "bold_prefix"
+CONF_WAIT = "wait"          # Anche default globale in configuration.yaml
+CONF_DEDUP_WINDOW = "dedup_window"  # Anche default globale in configuration.yaml
+CONF_COALESCE = "coalesce"
+CONF_RESTORE_VOLUME = "restore_volume"  # Anche default globale in configuration.yaml
+CONF_METRICS = "metrics"
+CONF_DELIVERED_EVENT = "delivered_event"
+CONF_GROUPS = "groups"
 
 # --- Chiavi Canale Singolo ---
 CONF_SERVICE = "service"
@@ -31,12 +41,79 @@ CONF_ENTITY_ID = "entity_id"
 CONF_IS_VOICE = "is_voice"
 CONF_ALT_SERVICES = "alt_services"
 CONF_TYPE = "type"
+CONF_TIMEOUT = "timeout"
+CONF_RETRY = "retry"
+CONF_CIRCUIT_BREAKER = "circuit_breaker"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_DND_POLICY = "dnd_policy"
+CONF_FANOUT = "fanout"
+CONF_SPLIT_SENTENCES = "split_sentences"
+CONF_TAGS = "tags"
+CONF_JOURNAL_TTL = "journal_ttl"
+
+# --- Chiavi Retry / Circuit Breaker ---
+CONF_ATTEMPTS = "attempts"
+CONF_BACKOFF = "backoff"
+CONF_MAX_BACKOFF = "max_backoff"
+CONF_JITTER = "jitter"
+CONF_RETRY_ON = "retry_on"
+CONF_THRESHOLD = "threshold"
+CONF_COOLDOWN = "cooldown"
+
+# --- Chiavi Rate Limit ---
+CONF_RATE = "rate"
+CONF_BURST = "burst"
+CONF_OVERFLOW = "overflow"
+CONF_MAX_QUEUE = "max_queue"
 
 # --- Defaults ---
 DEFAULT_NAME = "Hal9000"
 DEFAULT_DATE_FORMAT = "%H:%M:%S"
 DEFAULT_INCLUDE_TIME = True
 DEFAULT_BOLD_PREFIX = True
+DEFAULT_WAIT = True
+
+# --- Deduplica ---
+DEFAULT_DEDUP_WINDOW = 0    # Secondi; 0 = disattivata
+DEFAULT_COALESCE = False
+DEDUP_CACHE_SIZE = 256      # Chiavi ricordate al massimo
+
+# Timeout (secondi) di ogni chiamata di servizio di un canale
+DEFAULT_TIMEOUT = 30
+
+# --- Retry e Circuit Breaker ---
+DEFAULT_ATTEMPTS = 3
+DEFAULT_BACKOFF = 1.0       # Secondi prima del secondo tentativo (poi raddoppia)
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_JITTER = 0.2        # Frazione casuale sottratta all'attesa
+DEFAULT_THRESHOLD = 5       # Errori consecutivi prima di aprire il circuito
+DEFAULT_COOLDOWN = 60       # Secondi prima della consegna di prova
+
+# Categorie di errore (per 'retry_on')
+ERROR_TIMEOUT = "timeout"
+ERROR_ERROR = "error"           # HomeAssistantError generico dal servizio
+ERROR_NOT_FOUND = "not_found"   # Servizio inesistente
+ERROR_INVALID = "invalid"       # Payload rifiutato dallo schema del servizio
+ERROR_EXCEPTION = "exception"   # Qualsiasi altra eccezione
+ERROR_KINDS = [ERROR_TIMEOUT, ERROR_ERROR, ERROR_NOT_FOUND, ERROR_INVALID, ERROR_EXCEPTION]
+DEFAULT_RETRY_ON = [ERROR_TIMEOUT, ERROR_ERROR]
+
+# Stati del circuito
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+EVENT_CIRCUIT_CHANGED = f"{DOMAIN}_circuit_changed"
+
+# --- Rate Limit (token bucket) ---
+OVERFLOW_QUEUE = "queue"              # Attende il token; coda piena -> scarta il nuovo
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # Attende il token; coda piena -> scarta il più vecchio
+OVERFLOW_DROP_NEWEST = "drop_newest"  # Nessuna attesa: senza token il nuovo viene scartato
+OVERFLOW_POLICIES = [OVERFLOW_QUEUE, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST]
+DEFAULT_BURST = 1
+DEFAULT_MAX_QUEUE = 20
+
+# Secondi concessi alle code per svuotarsi allo stop di Home Assistant
+SHUTDOWN_DRAIN_TIMEOUT = 10
 
 # --- Default Time Slots & Volumes ---
 # Definisce quando inizia la fascia e il volume (0.0 - 1.0) di default per quella fascia
@@ -51,9 +128,90 @@ DEFAULT_TIME_SLOTS = {
 # Se non configurato, il DND è disabilitato di default (start == end)
 DEFAULT_DND = {"start": "23:00", "end": "06:00"}
 
+# --- Politica DND dei canali vocali ---
+DND_DROP = "drop"      # Il messaggio viene perso (comportamento storico)
+DND_DEFER = "defer"    # Consegnato alla fine del DND
+DND_DIGEST = "digest"  # Un unico riepilogo alla fine del DND
+DND_POLICIES = [DND_DROP, DND_DEFER, DND_DIGEST]
+DEFAULT_DND_POLICY = DND_DROP
+DND_BUFFER_SIZE = 50   # Notifiche trattenute al massimo
+DIGEST_INTRO = "Riepilogo notifiche"
+
+# --- Fan-out Telegram (più chat per canale) ---
+FANOUT_LIST = "list"          # Una sola chiamata con la lista dei chat_id
+FANOUT_PER_CHAT = "per_chat"  # Una chiamata per chat, in parallelo
+FANOUT_MODES = [FANOUT_LIST, FANOUT_PER_CHAT]
+DEFAULT_FANOUT = FANOUT_LIST
+FANOUT_CONCURRENCY = 5        # Chiamate contemporanee al massimo per consegna
+
+# --- Selezione dei target ---
+TAG_PREFIX = "tag:"     # targets: ["tag:speakers"] -> tutti i canali con quel tag
+GLOB_CACHE_SIZE = 128   # Pattern glob (es. speaker_*) ricordati già espansi
+UNKNOWN_TARGETS_SIZE = 128  # Target sconosciuti ricordati (un solo warning per nome)
+
+# --- Testi lunghi ---
+TELEGRAM_TEXT_LIMIT = 4096     # Caratteri massimi di un messaggio Telegram
+TELEGRAM_CAPTION_LIMIT = 1024  # Caratteri massimi di una didascalia (foto/video)
+DEFAULT_SPLIT_SENTENCES = False
+TTS_SENTENCE_MIN_LENGTH = 40   # Le frasi più corte vengono unite alle successive
+
+# --- Metriche ---
+DEFAULT_METRICS = False
+DEFAULT_DELIVERED_EVENT = False
+EVENT_DELIVERED = f"{DOMAIN}_delivered"
+METRICS_WINDOW = 200          # Campioni conservati per istogramma
+METRICS_PERCENTILES = (50, 95, 99)
+METRICS_CALL = "send"         # Metriche della chiamata (non legate a un canale)
+STAGE_CONTEXT = "context"     # Slot, volume, DND e saluto
+STAGE_RENDER = "render"       # Costruzione di testo e payload
+STAGE_VOLUME = "volume"       # volume_set in blocco
+STAGE_DELIVERY = "delivery"   # Chiamate di servizio del canale
+
+# --- Storage ---
+STORAGE_VERSION = 1
+STORAGE_KEY_DND = f"{DOMAIN}.dnd_buffer"
+STORAGE_SAVE_DELAY = 5  # Secondi (scritture raggruppate)
+STORAGE_KEY_JOURNAL = f"{DOMAIN}.journal"
+
+# --- Registro delle consegne ---
+DEFAULT_JOURNAL_TTL = 0      # Secondi entro cui ripetere dopo un riavvio (0 = non registrato)
+JOURNAL_SIZE = 200           # Elementi conservati al massimo
+JOURNAL_SAVE_DELAY = 1       # Secondi (scritture raggruppate, ma presto su disco)
+JOURNAL_PENDING = "pending"
+JOURNAL_DONE = "done"
+JOURNAL_FAILED = "failed"
+
 # --- Priority Settings ---
 PRIORITY_VOLUME = 0.9  # Volume al 90% se priority=True
 
+# Cosa fare dei messaggi non prioritari ancora in coda quando arriva una priorità
+PREEMPT_KEEP = "keep"          # Restano in coda (la priorità passa comunque avanti)
+PREEMPT_DROP = "drop"          # Vengono scartati
+PREEMPT_COLLAPSE = "collapse"  # Resta solo il più recente per ogni canale
+PREEMPT_MODES = [PREEMPT_KEEP, PREEMPT_DROP, PREEMPT_COLLAPSE]
+DEFAULT_PRIORITY_PREEMPT = PREEMPT_KEEP
+
+# --- Esiti delle consegne ---
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_PARTIAL = "partial"        # Consegnato solo ad alcune chat
+STATUS_TIMEOUT = "timeout"
+STATUS_DROPPED = "dropped"        # Scartato in coda da un messaggio prioritario
+STATUS_CANCELLED = "cancelled"    # Annullato allo stop di Home Assistant
+STATUS_CIRCUIT_OPEN = "circuit_open"
+STATUS_SKIPPED_DND = "skipped_dnd"
+STATUS_DEFERRED = "deferred"      # Trattenuto fino alla fine del DND
+STATUS_UNKNOWN = "unknown"        # Alias non configurato
+STATUS_DUPLICATE = "duplicate"    # Scartato dalla deduplica
+STATUS_RATE_LIMITED = "rate_limited"
+
+# --- Volume ---
+DEFAULT_RESTORE_VOLUME = False
+VOLUME_TOLERANCE = 0.01     # Differenza sotto la quale il volume_set è superfluo
+PLAYBACK_START_TIMEOUT = 5  # Secondi di attesa perché l'annuncio inizi
+PLAYBACK_MAX_WAIT = 120     # Secondi massimi di attesa della fine dell'annuncio
+SPEECH_CHARS_PER_SECOND = 12  # Velocità stimata della voce (attesa massima tra le frasi)
+
 # --- Default Greetings ---
 DEFAULT_GREETINGS = {
     "morning": ["Buongiorno", "Ben alzato", "Salve", "Buondì"],
@@ -0,0 +1,43 @@
+# /config/custom_components/universal_notifier/dedup.py
+
+"""Cache TTL limitata per scartare le notifiche ripetute."""
+
+import time
+from collections import OrderedDict
+
+from .const import DEDUP_CACHE_SIZE
+
+
+def dedup_key(message, title, target: str, service_type) -> int:
+    """Chiave di deduplica: hash di messaggio, titolo, target e tipo."""
+    return hash((str(message), title, target, service_type))
+
+
+class DedupCache:
+    """Ricorda le chiavi viste negli ultimi 'window' secondi (massimo max_size).
+
+    La finestra parte dal primo messaggio: le ripetizioni non la prolungano.
+    Oltre max_size vengono dimenticate le chiavi più vecchie.
+    """
+
+    __slots__ = ("_entries", "_max_size")
+
+    def __init__(self, max_size: int = DEDUP_CACHE_SIZE):
+        self._entries = OrderedDict()  # chiave -> scadenza (monotonic)
+        self._max_size = max_size
+
+    def seen(self, key: int, window: float) -> bool:
+        """True se la chiave è già stata vista nella finestra, altrimenti la registra."""
+        now = time.monotonic()
+        expires = self._entries.get(key)
+        if expires is not None and expires > now:
+            return True
+
+        self._entries[key] = now + window
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        return False
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,548 @@
+# /config/custom_components/universal_notifier/delivery.py
+
+"""Scheduler delle consegne: una coda serializzata per ogni player fisico."""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+
+from homeassistant.core import Context, HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import (
+    DEFAULT_TIMEOUT, ERROR_TIMEOUT, FANOUT_CONCURRENCY, PREEMPT_COLLAPSE, PREEMPT_KEEP,
+    OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST,
+    STATUS_CANCELLED, STATUS_CIRCUIT_OPEN, STATUS_DROPPED, STATUS_FAILED,
+    STATUS_PARTIAL, STATUS_RATE_LIMITED, STATUS_SENT, STATUS_TIMEOUT,
+)
+from .resilience import (
+    NO_RETRY, CircuitBreaker, RetryPolicy, TokenBucket, classify_error,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ServiceStep:
+    """Singola chiamata di servizio di una consegna.
+
+    Gli step non obbligatori (es. volume_set) possono fallire senza
+    interrompere la consegna. 'label' identifica lo step nei dettagli
+    dell'esito (es. il chat_id di un fan-out Telegram).
+    """
+
+    __slots__ = ("domain", "service", "data", "required", "label")
+
+    def __init__(
+        self, domain: str, service: str, data: dict, required: bool = True, label: str = None,
+    ):
+        self.domain = domain
+        self.service = service
+        self.data = data
+        self.required = required
+        self.label = label
+
+    def __repr__(self):
+        return f"<ServiceStep {self.domain}.{self.service} {self.data}>"
+
+
+class WaitStep:
+    """Step che attende una condizione (es. fine riproduzione) senza chiamare servizi.
+
+    Non è mai obbligatorio e non è soggetto al timeout del canale: la
+    coroutine deve gestire da sé la durata massima dell'attesa.
+    """
+
+    __slots__ = ("description", "wait")
+
+    required = False
+
+    def __init__(self, description: str, wait):
+        self.description = description
+        self.wait = wait  # Callable senza argomenti che restituisce una coroutine
+
+    def __repr__(self):
+        return f"<WaitStep {self.description}>"
+
+
+class DeliveryResult:
+    """Esito della consegna a un target."""
+
+    __slots__ = ("target", "status", "service", "error", "elapsed", "details", "volume")
+
+    def __init__(
+        self, target: str, status: str, service: str = None, error: str = None,
+        elapsed: float = None, details: dict = None, volume: float = None,
+    ):
+        self.target = target
+        self.status = status
+        self.service = service
+        self.error = error
+        self.elapsed = elapsed
+        self.details = details  # label -> esito, per gli step etichettati
+        self.volume = volume    # Volume calcolato (solo canali vocali)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == STATUS_SENT
+
+    def as_dict(self) -> dict:
+        data = {
+            "target": self.target,
+            "status": self.status,
+            "service": self.service,
+            "volume": self.volume,
+            "elapsed_ms": round(self.elapsed * 1000, 1) if self.elapsed is not None else None,
+            "error": self.error,
+        }
+        if self.details:
+            data["details"] = dict(self.details)
+        return data
+
+    def __repr__(self):
+        return f"<DeliveryResult {self.target} {self.status} {self.error or ''}>"
+
+
+def channel_lane(alias: str) -> str:
+    """Lane di un canale senza player fisici (Telegram, app mobile...)."""
+    return f"channel:{alias}"
+
+
+class DeliveryJob:
+    """Consegna verso un canale: step eseguiti in ordine sulle lane indicate.
+
+    Le lane sono i media_player fisici coinvolti (o il canale stesso se non
+    ne ha): due job che condividono una lane non si sovrappongono mai.
+    """
+
+    __slots__ = (
+        "target", "service", "lanes", "steps", "context", "priority", "timeout",
+        "retry", "breaker", "bucket", "merge_sep", "parallel", "text_limit", "volume",
+        "preemptible", "after", "created", "seq", "started", "detached", "future",
+    )
+
+    def __init__(
+        self, target: str, service: str, steps: list, lanes,
+        context: Context = None, priority: bool = False,
+        timeout: float = DEFAULT_TIMEOUT, retry: RetryPolicy = NO_RETRY,
+        breaker: CircuitBreaker = None, bucket: TokenBucket = None,
+        merge_sep: str = None, parallel: bool = False, text_limit: int = None,
+        volume: float = None, preemptible: bool = True,
+    ):
+        self.target = target
+        self.service = service
+        self.steps = steps
+        self.lanes = tuple(sorted(set(lanes)))
+        self.context = context
+        self.priority = priority
+        self.timeout = timeout
+        self.retry = retry
+        self.breaker = breaker
+        self.bucket = bucket
+        self.merge_sep = merge_sep  # None: messaggio non accorpabile (es. comandi)
+        self.parallel = parallel    # Step indipendenti, eseguiti insieme
+        self.text_limit = text_limit  # Lunghezza massima del testo accorpato
+        self.volume = volume        # Volume calcolato, riportato nell'esito
+        self.preemptible = preemptible  # False: mai scartato da un job prioritario
+        self.after = None           # Future da attendere prima di partire
+        self.created = time.monotonic()
+        self.seq = 0
+        self.started = False
+        self.detached = False
+        self.future = None
+
+    def merge(self, other: "DeliveryJob") -> bool:
+        """Accoda il testo di 'other' a questo job se le due consegne sono compatibili.
+
+        Compatibili: stesso servizio e priorità, stessi step e payload di ogni
+        step identici a parte il testo ('message' o 'caption'), che viene
+        accodato in tutti gli step (es. ogni chat di un fan-out) purché
+        resti entro 'text_limit'.
+        """
+        if (
+            self.merge_sep is None or other.merge_sep is None
+            or self.service != other.service or self.priority != other.priority
+            or self.parallel != other.parallel or len(self.steps) != len(other.steps)
+        ):
+            return False
+
+        texts = []
+        for mine, theirs in zip(self.steps, other.steps):
+            if (mine.domain, mine.service) != (theirs.domain, theirs.service):
+                return False
+            mine, theirs = mine.data, theirs.data
+            field = "caption" if "caption" in mine else "message"
+            if field not in mine or field not in theirs:
+                return False
+            if len(mine) != len(theirs) or any(
+                theirs.get(key) != value for key, value in mine.items() if key != field
+            ):
+                return False
+            # Il titolo di send_message finisce nello stesso testo ("titolo\nmessaggio")
+            reserved = len(mine["title"]) + 1 if field == "message" and mine.get("title") else 0
+            if self.text_limit is not None and (
+                reserved + len(mine[field]) + len(self.merge_sep) + len(theirs[field]) > self.text_limit
+            ):
+                return False
+            texts.append((mine, field, theirs[field]))
+
+        for mine, field, text in texts:
+            mine[field] = f"{mine[field]}{self.merge_sep}{text}"
+        return True
+
+    def __repr__(self):
+        return f"<DeliveryJob {self.target} lanes={self.lanes} steps={len(self.steps)}>"
+
+
+class DeliveryScheduler:
+    """Serializza le consegne per player e parallelizza tra player diversi.
+
+    Ogni job finisce nella coda della sua prima lane (ordine alfabetico),
+    servita da un worker dedicato; prima di eseguire, il worker acquisisce
+    i lock di tutte le lane del job nello stesso ordine (niente deadlock).
+    Le code sono a priorità: i job 'priority' scavalcano quelli in attesa
+    e, secondo 'preempt', i job non prioritari ancora in coda sulle stesse
+    lane vengono mantenuti, scartati o ridotti all'ultimo per canale.
+    Se il canale ha un rate limit, ogni chiamata attende un token e i job
+    in attesa per quel canale sono limitati secondo la politica di overflow
+    (i job prioritari non attendono e non vengono mai scartati).
+    Allo stop di Home Assistant le code vengono svuotate entro un timeout,
+    poi i worker e i job rimasti (in coda o in esecuzione) vengono annullati.
+    """
+
+    def __init__(self, hass: HomeAssistant, preempt: str = PREEMPT_KEEP):
+        self._hass = hass
+        self.preempt = preempt  # Modificabile con il reload
+        self._queues = {}
+        self._locks = {}
+        self._pending = {}  # lane -> job in attesa che la coinvolgono
+        self._backlog = {}  # target -> job in attesa, in ordine di arrivo
+        self._seq = itertools.count()
+        self._workers = set()
+        self._running = set()  # job partiti e non ancora conclusi
+        self._closing = False
+
+    def submit(
+        self, job: DeliveryJob, detached: bool = False, coalesce_window: float = 0,
+        after: asyncio.Future = None,
+    ) -> asyncio.Future:
+        """Accoda il job e restituisce un future con il suo DeliveryResult.
+
+        Il future non solleva mai eccezioni: ogni consegna riesce o fallisce
+        per conto suo. Con detached=True nessuno lo attende e gli errori
+        vengono registrati nel log. Con coalesce_window > 0 il testo viene
+        accorpato all'ultimo job dello stesso target ancora in coda, se
+        creato da meno di coalesce_window secondi. Con 'after' il job parte
+        solo quando quel future è risolto (es. volume prima della voce).
+        """
+        if self._closing:
+            raise HomeAssistantError("UniNotifier: Arresto in corso, notifica non accodata")
+
+        backlog = self._backlog.get(job.target)
+        if coalesce_window > 0 and backlog:
+            last = backlog[-1]
+            if job.created - last.created <= coalesce_window and last.merge(job):
+                _LOGGER.debug("UniNotifier: Messaggio per '%s' accorpato al job in coda", job.target)
+                return last.future
+
+        job.detached = detached
+        job.after = after
+        job.future = self._hass.loop.create_future()
+
+        if job.bucket is not None and not job.priority and not self._admit(job, backlog):
+            _LOGGER.info("UniNotifier: Skipped '%s' (rate limit, coda piena)", job.target)
+            self._resolve(job, DeliveryResult(
+                job.target, STATUS_RATE_LIMITED, job.service, "Rate limit superato"
+            ))
+            return job.future
+
+        if job.priority and self.preempt != PREEMPT_KEEP:
+            self._preempt_pending(job)
+
+        for lane in job.lanes:
+            self._pending.setdefault(lane, set()).add(job)
+        self._backlog.setdefault(job.target, deque()).append(job)
+
+        lane = job.lanes[0]
+        queue = self._queues.get(lane)
+        if queue is None:
+            queue = self._queues[lane] = asyncio.PriorityQueue()
+            self._track(self._workers, self._hass.async_create_background_task(
+                self._async_worker(queue), f"universal_notifier lane {lane}"
+            ))
+        # (rango, sequenza): priorità prima, poi ordine di arrivo
+        job.seq = next(self._seq)
+        queue.put_nowait((0 if job.priority else 1, job.seq, job))
+        return job.future
+
+    def cancel(self, job: DeliveryJob, error: str) -> bool:
+        """Annulla un job accodato e non ancora partito (False se già partito o concluso)."""
+        if job.started or job.future is None or job.future.done():
+            return False
+        self._drop(job, STATUS_CANCELLED, error)
+        return True
+
+    def is_idle(self, lane: str) -> bool:
+        """True se sulla lane non ci sono job in attesa né in esecuzione."""
+        lock = self._locks.get(lane)
+        return not self._pending.get(lane) and (lock is None or not lock.locked())
+
+    def _admit(self, job: DeliveryJob, backlog) -> bool:
+        """Applica la politica di overflow del rate limit al nuovo job."""
+        bucket = job.bucket
+        queued = len(backlog) if backlog else 0
+        if bucket.overflow == OVERFLOW_DROP_NEWEST:
+            # Nessuna attesa: serve un token libero oltre a quelli già prenotati
+            return bucket.available() - queued >= 1
+        if queued < bucket.max_queue:
+            return True
+        if bucket.overflow == OVERFLOW_DROP_OLDEST:
+            oldest = next((old for old in backlog if not old.priority), None)
+            if oldest is not None:
+                _LOGGER.info("UniNotifier: Scartata consegna più vecchia per '%s' (rate limit)", job.target)
+                self._drop(oldest, STATUS_RATE_LIMITED, "Rate limit superato")
+                return True
+        return False
+
+    def _drop(self, job: DeliveryJob, status: str, error: str):
+        """Toglie dalla coda un job non ancora partito, con l'esito indicato."""
+        self._release(job)
+        self._resolve(job, DeliveryResult(job.target, status, job.service, error))
+
+    @staticmethod
+    def _track(tasks: set, task: asyncio.Task):
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def async_shutdown(self, timeout: float):
+        """Smette di accettare job, attende lo svuotamento delle code e chiude."""
+        self._closing = True
+
+        waiting = [queue.join() for queue in self._queues.values()]
+        if waiting:
+            try:
+                async with asyncio.timeout(timeout):
+                    await asyncio.gather(*waiting)
+            except TimeoutError:
+                _LOGGER.warning(
+                    "UniNotifier: Consegne non completate entro %ss dall'arresto, annullate",
+                    timeout,
+                )
+
+        for task in self._workers:
+            task.cancel()
+        # Anche i job già partiti: chi attende il future non resta appeso
+        stopped = set(self._running)
+        for pending in self._pending.values():
+            stopped.update(pending)
+        for job in stopped:
+            self._resolve(job, DeliveryResult(
+                job.target, STATUS_CANCELLED, job.service, "Arresto di Home Assistant"
+            ))
+        self._pending.clear()
+        self._running.clear()
+        self._backlog.clear()
+
+    def _preempt_pending(self, priority_job: DeliveryJob):
+        """Scarta i job non prioritari in attesa sulle lane del job prioritario."""
+        stale = {
+            job
+            for lane in priority_job.lanes
+            for job in self._pending.get(lane, ())
+            if not job.priority and not job.started and job.preemptible
+        }
+        if self.preempt == PREEMPT_COLLAPSE:
+            # Tiene solo il job più recente per ogni canale
+            latest = {}
+            for job in stale:
+                current = latest.get(job.target)
+                if current is None or job.seq > current.seq:
+                    latest[job.target] = job
+            stale.difference_update(latest.values())
+
+        for job in stale:
+            _LOGGER.info(
+                "UniNotifier: Scartata consegna in coda per '%s' (arrivata priorità per '%s')",
+                job.target, priority_job.target,
+            )
+            self._drop(job, STATUS_DROPPED, f"Scartato per priorità su '{priority_job.target}'")
+
+    def _release(self, job: DeliveryJob):
+        """Marca il job come non più in attesa sulle sue lane."""
+        job.started = True
+        for lane in job.lanes:
+            pending = self._pending.get(lane)
+            if pending is not None:
+                pending.discard(job)
+        backlog = self._backlog.get(job.target)
+        if backlog is not None:
+            try:
+                backlog.remove(job)
+            except ValueError:
+                pass
+            if not backlog:
+                del self._backlog[job.target]
+
+    async def _async_worker(self, queue: asyncio.PriorityQueue):
+        """Consuma la coda di una lane, un job alla volta."""
+        while True:
+            item = await queue.get()
+            job = item[2]
+            try:
+                if job.future.done():
+                    # Scartato da un job prioritario mentre era in coda
+                    continue
+                if job.after is not None and not job.after.done():
+                    # Non blocca il worker: il job rientra in coda (con la sua
+                    # posizione originale) appena la dipendenza è risolta
+                    job.after.add_done_callback(lambda _, item=item: queue.put_nowait(item))
+                    continue
+                async with AsyncExitStack() as stack:
+                    for lane in job.lanes:
+                        await stack.enter_async_context(self._lock(lane))
+                    if job.future.done():
+                        continue
+                    self._release(job)
+                    self._running.add(job)
+                    try:
+                        await self._async_run(job)
+                    except asyncio.CancelledError:
+                        # Worker annullato a metà consegna: chi attende ha comunque un esito
+                        self._resolve(job, DeliveryResult(
+                            job.target, STATUS_CANCELLED, job.service, "Arresto di Home Assistant"
+                        ))
+                        raise
+                    finally:
+                        self._running.discard(job)
+            finally:
+                queue.task_done()
+
+    def _lock(self, lane: str) -> asyncio.Lock:
+        lock = self._locks.get(lane)
+        if lock is None:
+            lock = self._locks[lane] = asyncio.Lock()
+        return lock
+
+    @staticmethod
+    def _resolve(job: DeliveryJob, result: DeliveryResult):
+        if result.volume is None:
+            result.volume = job.volume
+        if not job.future.done():
+            job.future.set_result(result)
+
+    async def _async_call(self, job: DeliveryJob, step: ServiceStep):
+        """Un tentativo di chiamata, entro il timeout del canale."""
+        if step.required and job.bucket is not None:
+            await job.bucket.acquire(job.priority)
+        async with asyncio.timeout(job.timeout):
+            await self._hass.services.async_call(
+                step.domain, step.service, step.data,
+                blocking=True, context=job.context,
+            )
+
+    async def _async_step(self, job: DeliveryJob, step: ServiceStep):
+        """Esegue uno step con i retry della policy: None se riuscito, altrimenti (esito, errore)."""
+        _LOGGER.debug("UniNotifier: %s -> %s", job.target, step)
+        if isinstance(step, WaitStep):
+            try:
+                await step.wait()
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning("UniNotifier: '%s' %s: %s (proseguo)", job.target, step.description, err)
+            return None
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self._async_call(job, step)
+                return None
+            except Exception as err:  # pylint: disable=broad-except
+                kind = classify_error(err)
+                if kind == ERROR_TIMEOUT:
+                    outcome = (
+                        STATUS_TIMEOUT,
+                        f"{step.domain}.{step.service}: nessuna risposta entro {job.timeout}s",
+                    )
+                else:
+                    outcome = (STATUS_FAILED, f"{step.domain}.{step.service}: {err}")
+                if not (step.required and job.retry.should_retry(kind, attempt)):
+                    break
+                delay = job.retry.delay(attempt)
+                _LOGGER.info(
+                    "UniNotifier: '%s' tentativo %d fallito (%s), riprovo tra %.1fs",
+                    job.target, attempt, outcome[1], delay,
+                )
+                await asyncio.sleep(delay)
+
+        if not step.required:
+            _LOGGER.warning("UniNotifier: '%s' %s (proseguo)", job.target, outcome[1])
+            return None
+        return outcome
+
+    async def _async_run(self, job: DeliveryJob):
+        """Esegue gli step in ordine (blocking: il volume precede la voce).
+
+        Ogni chiamata ha il timeout del canale e, se obbligatoria, viene
+        ripetuta secondo la RetryPolicy; il primo step obbligatorio che
+        fallisce chiude la consegna con il relativo esito, che aggiorna
+        il circuit breaker del canale. I job 'parallel' eseguono gli step
+        insieme (al massimo FANOUT_CONCURRENCY alla volta), tranne quelli con
+        la stessa 'label' che formano una catena in ordine (es. i pezzi di un
+        messaggio lungo verso la stessa chat): se solo una parte delle catene
+        fallisce l'esito è 'partial', che per il circuit breaker conta come
+        un successo.
+        """
+        start = time.perf_counter()
+        status, error, details = STATUS_SENT, None, None
+
+        if job.breaker is not None and job.breaker.is_open:
+            # Circuito aperto mentre il job era in coda
+            status, error = STATUS_CIRCUIT_OPEN, "Circuito aperto"
+        elif job.parallel:
+            chains = {}
+            for step in job.steps:
+                chains.setdefault(step.label if step.label is not None else id(step), []).append(step)
+            limit = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+            async def _async_chain(chain):
+                async with limit:
+                    for step in chain:
+                        failure = await self._async_step(job, step)
+                        if failure:
+                            return failure
+                    return None
+
+            outcomes = await asyncio.gather(*(_async_chain(chain) for chain in chains.values()))
+            failures = [outcome for outcome in outcomes if outcome]
+            if failures:
+                status, error = failures[0]
+                required = sum(
+                    1 for chain in chains.values() if any(step.required for step in chain)
+                )
+                if len(failures) < required:
+                    status = STATUS_PARTIAL
+                    error = "; ".join(failure[1] for failure in failures)
+            details = {
+                key: outcome[0] if outcome else STATUS_SENT
+                for key, outcome in zip(chains, outcomes) if isinstance(key, str)
+            } or None
+        else:
+            for step in job.steps:
+                failure = await self._async_step(job, step)
+                if failure:
+                    status, error = failure
+                    break
+
+        if job.breaker is not None and status != STATUS_CIRCUIT_OPEN:
+            if status in (STATUS_SENT, STATUS_PARTIAL):
+                job.breaker.record_success()
+            else:
+                job.breaker.record_failure()
+
+        result = DeliveryResult(
+            job.target, status, job.service, error, time.perf_counter() - start, details
+        )
+        if error and job.detached:
+            _LOGGER.error("UniNotifier: Consegna a '%s' fallita: %s", job.target, error)
+        self._resolve(job, result)
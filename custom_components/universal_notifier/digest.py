@@ -0,0 +1,110 @@
+# /config/custom_components/universal_notifier/digest.py
+
+"""Buffer persistente delle notifiche vocali trattenute durante il DND."""
+
+import logging
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_time
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    CONF_MESSAGE, CONF_TITLE, CONF_TYPE, DIGEST_INTRO, DND_BUFFER_SIZE,
+    DND_DIGEST, STORAGE_KEY_DND, STORAGE_SAVE_DELAY, STORAGE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def build_digest(items: list) -> str:
+    """Un solo testo per tutte le notifiche trattenute di un canale."""
+    parts = []
+    for item in items:
+        text = str(item[CONF_MESSAGE]).strip().rstrip(".")
+        if item.get(CONF_TITLE):
+            text = f"{item[CONF_TITLE]}: {text}"
+        parts.append(text)
+    return f"{DIGEST_INTRO}: " + ". ".join(parts) + "."
+
+
+class DndBuffer:
+    """Notifiche trattenute durante il DND, consegnate da un unico timer alla fine.
+
+    Il buffer è limitato (vengono scartate le più vecchie) e salvato con
+    Store, così sopravvive ai riavvii. Allo scadere del timer 'flush'
+    riceve, per ogni canale, le notifiche da consegnare: una per elemento
+    con policy 'defer', un unico riepilogo per i canali 'digest'.
+    """
+
+    def __init__(self, hass: HomeAssistant, flush, max_items: int = DND_BUFFER_SIZE):
+        self._hass = hass
+        self._flush = flush  # async (canale, [elementi]) -> None
+        self._max_items = max_items
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_DND)
+        self._items = []
+        self._unsub_timer = None
+
+    def __len__(self):
+        return len(self._items)
+
+    async def async_load(self):
+        data = await self._store.async_load()
+        self._items = list((data or {}).get("items", []))[-self._max_items:]
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"items": self._items}
+
+    @callback
+    def add(self, channel: str, policy: str, message, title=None, service_type=None):
+        """Trattiene una notifica; oltre il limite scarta la più vecchia."""
+        self._items.append({
+            "channel": channel,
+            "policy": policy,
+            CONF_MESSAGE: str(message),
+            CONF_TITLE: title,
+            CONF_TYPE: service_type,
+            "ts": dt_util.utcnow().isoformat(),
+        })
+        if len(self._items) > self._max_items:
+            dropped = self._items.pop(0)
+            _LOGGER.warning("UniNotifier: Buffer DND pieno, scartata notifica per '%s'", dropped["channel"])
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def schedule(self, when: datetime):
+        """Programma la consegna (un solo timer, il primo orario vince)."""
+        if self._unsub_timer is None and self._items and when is not None:
+            _LOGGER.debug("UniNotifier: %d notifiche DND in consegna alle %s", len(self._items), when)
+            self._unsub_timer = async_track_point_in_time(self._hass, self._async_fire, when)
+
+    @callback
+    def cancel(self):
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+
+    async def _async_fire(self, now: datetime):
+        self._unsub_timer = None
+        await self.async_flush()
+
+    async def async_flush(self):
+        """Consegna tutto il contenuto del buffer e lo svuota."""
+        items, self._items = self._items, []
+        self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+        if not items:
+            return
+
+        by_channel = {}
+        for item in items:
+            by_channel.setdefault(item["channel"], []).append(item)
+
+        for channel, channel_items in by_channel.items():
+            if channel_items[-1]["policy"] == DND_DIGEST and len(channel_items) > 1:
+                channel_items = [{CONF_MESSAGE: build_digest(channel_items), CONF_TITLE: None, CONF_TYPE: None}]
+            try:
+                await self._flush(channel, channel_items)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error("UniNotifier: Consegna notifiche DND per '%s' fallita: %s", channel, err)
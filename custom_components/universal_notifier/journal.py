@@ -0,0 +1,117 @@
+# /config/custom_components/universal_notifier/journal.py
+
+"""Registro persistente delle consegne, per ripeterle dopo un riavvio."""
+
+import logging
+import time
+from collections import OrderedDict
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    JOURNAL_DONE, JOURNAL_FAILED, JOURNAL_PENDING, JOURNAL_SAVE_DELAY, JOURNAL_SIZE,
+    STATUS_CANCELLED, STATUS_DEFERRED, STATUS_PARTIAL, STATUS_SENT, STORAGE_KEY_JOURNAL, STORAGE_VERSION,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeliveryJournal:
+    """Anello limitato di consegne: pending finché non arriva l'esito, poi done o failed.
+
+    Gli elementi sono compatti (chiavi di una lettera) e le scritture su
+    disco passano da Store con un ritardo, così più consegne finiscono
+    nello stesso salvataggio e il JSON viene scritto fuori dal loop.
+    Oltre 'max_entries' vengono dimenticati gli elementi più vecchi.
+    """
+
+    def __init__(self, hass: HomeAssistant, max_entries: int = JOURNAL_SIZE):
+        self._hass = hass
+        self._max_entries = max_entries
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY_JOURNAL)
+        self._entries = OrderedDict()  # id -> elemento
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        self._seq = data.get("seq", 0)
+        for entry in data.get("entries", [])[-self._max_entries:]:
+            self._entries[entry["id"]] = entry
+
+    @callback
+    def _data_to_save(self) -> dict:
+        return {"seq": self._seq, "entries": list(self._entries.values())}
+
+    @callback
+    def _save(self):
+        self._store.async_delay_save(self._data_to_save, JOURNAL_SAVE_DELAY)
+
+    @callback
+    def add(
+        self, channel: str, message, title=None, service_type=None, data=None,
+        priority: bool = False, ttl: float = 0,
+    ) -> int:
+        """Registra una consegna in partenza (pending) e ne restituisce l'id."""
+        self._seq += 1
+        now = time.time()
+        entry = {"id": self._seq, "c": channel, "m": str(message), "s": JOURNAL_PENDING, "x": round(now + ttl)}
+        # Solo i campi valorizzati, per tenere il file piccolo
+        if title:
+            entry["t"] = title
+        if service_type:
+            entry["y"] = service_type
+        if data:
+            entry["d"] = data
+        if priority:
+            entry["p"] = True
+        self._entries[self._seq] = entry
+
+        while len(self._entries) > self._max_entries:
+            _, dropped = self._entries.popitem(last=False)
+            if dropped["s"] == JOURNAL_PENDING:
+                _LOGGER.warning("UniNotifier: Registro consegne pieno, dimenticata consegna per '%s'", dropped["c"])
+        self._save()
+        return self._seq
+
+    @callback
+    def finish(self, entry_id: int, status: str):
+        """Esito di una consegna: annullata allo stop resta pending e verrà ripetuta.
+
+        Rimandata a fine DND vale come done: il buffer DND è già persistente.
+        """
+        entry = self._entries.get(entry_id)
+        if entry is None or status == STATUS_CANCELLED:
+            return
+        entry["s"] = (
+            JOURNAL_DONE if status in (STATUS_SENT, STATUS_PARTIAL, STATUS_DEFERRED) else JOURNAL_FAILED
+        )
+        self._save()
+
+    @callback
+    def take_pending(self) -> list:
+        """Consegne rimaste pending e non scadute, da ripetere.
+
+        Restano pending finché la ripetizione (che riusa lo stesso id, e
+        quindi la stessa scadenza) non chiama finish(): un nuovo arresto
+        prima dell'esito le ripete ancora, ma mai oltre la scadenza
+        originale. Quelle scadute sono segnate failed.
+        """
+        now = time.time()
+        pending = []
+        changed = False
+        for entry in self._entries.values():
+            if entry["s"] != JOURNAL_PENDING:
+                continue
+            if entry["x"] > now:
+                pending.append(entry)
+            else:
+                _LOGGER.info("UniNotifier: Consegna per '%s' scaduta, non ripetuta", entry["c"])
+                entry["s"] = JOURNAL_FAILED
+                changed = True
+        if changed:
+            self._save()
+        return pending
@@ -0,0 +1,130 @@
+# /config/custom_components/universal_notifier/metrics.py
+
+"""Tempi per fase e per canale, su finestre mobili di campioni."""
+
+import math
+from collections import deque
+
+from homeassistant.core import callback
+
+from .const import METRICS_PERCENTILES, METRICS_WINDOW, STAGE_DELIVERY, STATUS_UNKNOWN
+
+
+class LatencyWindow:
+    """Ultimi 'size' campioni (secondi) con i percentili calcolati a richiesta."""
+
+    __slots__ = ("_samples",)
+
+    def __init__(self, size: int = METRICS_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, quantile: float):
+        """Percentile (nearest-rank) in millisecondi, None senza campioni."""
+        if not self._samples:
+            return None
+        return _nearest_rank(sorted(self._samples), quantile)
+
+    def as_dict(self) -> dict:
+        if not self._samples:
+            return {}
+        ordered = sorted(self._samples)
+        return {
+            f"p{quantile}": _nearest_rank(ordered, quantile) for quantile in METRICS_PERCENTILES
+        }
+
+
+def _nearest_rank(ordered: list, quantile: float) -> float:
+    idx = max(0, math.ceil(quantile / 100 * len(ordered)) - 1)
+    return round(ordered[idx] * 1000, 1)
+
+
+class ChannelMetrics:
+    """Conteggi ed esiti di un canale, con una finestra di tempi per fase."""
+
+    __slots__ = ("channel", "count", "errors", "statuses", "stages")
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.count = 0
+        self.errors = 0
+        self.statuses = {}
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        window = self.stages.get(stage)
+        if window is None:
+            window = self.stages[stage] = LatencyWindow()
+        window.add(seconds)
+
+    def latency(self, stage: str = STAGE_DELIVERY, quantile: float = 95):
+        window = self.stages.get(stage)
+        return window.percentile(quantile) if window is not None else None
+
+    def as_dict(self) -> dict:
+        data = {"count": self.count, "errors": self.errors, "statuses": dict(self.statuses)}
+        for stage, window in self.stages.items():
+            for key, value in window.as_dict().items():
+                data[f"{stage}_{key}_ms"] = value
+        return data
+
+
+class DeliveryMetrics:
+    """Metriche di tutti i canali; avvisa i listener del canale a ogni esito.
+
+    I tempi sono in secondi (misurati con perf_counter) e restano in
+    memoria: i percentili vengono calcolati solo quando un sensore li legge.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._listeners = {}
+
+    def channel(self, channel: str) -> ChannelMetrics:
+        metrics = self._channels.get(channel)
+        if metrics is None:
+            metrics = self._channels[channel] = ChannelMetrics(channel)
+        return metrics
+
+    def record(self, channel: str, stage: str, seconds: float):
+        self.channel(channel).add(stage, seconds)
+
+    @callback
+    def record_result(self, result):
+        """Registra l'esito (DeliveryResult) di un target e aggiorna i sensori.
+
+        I target sconosciuti non sono canali: niente metriche, che
+        altrimenti crescerebbero con ogni nome (o glob) ricevuto.
+        """
+        if result.status == STATUS_UNKNOWN:
+            return
+        metrics = self.channel(result.target)
+        metrics.count += 1
+        metrics.statuses[result.status] = metrics.statuses.get(result.status, 0) + 1
+        if result.error:
+            metrics.errors += 1
+        if result.elapsed is not None:
+            metrics.add(STAGE_DELIVERY, result.elapsed)
+        self.async_notify(result.target)
+
+    @callback
+    def async_notify(self, channel: str):
+        for listener in self._listeners.get(channel, ()):
+            listener()
+
+    @callback
+    def async_add_listener(self, channel: str, listener):
+        """Listener chiamato a ogni aggiornamento del canale; restituisce l'unsub."""
+        listeners = self._listeners.setdefault(channel, [])
+        listeners.append(listener)
+
+        @callback
+        def _remove():
+            listeners.remove(listener)
+
+        return _remove
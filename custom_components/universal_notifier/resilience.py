@@ -0,0 +1,190 @@
+# /config/custom_components/universal_notifier/resilience.py
+
+"""Retry con backoff esponenziale, circuit breaker e rate limit per canale."""
+
+import asyncio
+import logging
+import random
+import time
+
+import voluptuous as vol
+from homeassistant.exceptions import HomeAssistantError, ServiceNotFound
+
+try:
+    from homeassistant.exceptions import ServiceValidationError
+except ImportError:  # Home Assistant < 2023.11
+    ServiceValidationError = vol.Invalid
+
+from .const import (
+    ERROR_ERROR, ERROR_EXCEPTION, ERROR_INVALID, ERROR_NOT_FOUND, ERROR_TIMEOUT,
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, OVERFLOW_QUEUE,
+    DEFAULT_MAX_QUEUE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def classify_error(err: BaseException) -> str:
+    """Categoria di un errore, confrontata con 'retry_on' della policy."""
+    if isinstance(err, TimeoutError):
+        return ERROR_TIMEOUT
+    if isinstance(err, ServiceNotFound):
+        return ERROR_NOT_FOUND
+    if isinstance(err, (vol.Invalid, ServiceValidationError)):
+        return ERROR_INVALID
+    if isinstance(err, HomeAssistantError):
+        return ERROR_ERROR
+    return ERROR_EXCEPTION
+
+
+class RetryPolicy:
+    """Numero di tentativi e attesa tra un tentativo e l'altro."""
+
+    __slots__ = ("attempts", "backoff", "max_backoff", "jitter", "retry_on")
+
+    def __init__(
+        self, attempts: int = 1, backoff: float = 1.0, max_backoff: float = 30.0,
+        jitter: float = 0.2, retry_on=(ERROR_TIMEOUT, ERROR_ERROR),
+    ):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_on = frozenset(retry_on)
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        """True se dopo il tentativo 'attempt' (da 1) fallito con 'kind' si riprova."""
+        return attempt < self.attempts and kind in self.retry_on
+
+    def delay(self, attempt: int) -> float:
+        """Attesa prima del tentativo successivo: backoff * 2^(n-1), con jitter."""
+        base = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return base * random.uniform(1 - self.jitter, 1)
+
+
+# Policy senza retry, condivisa dai canali che non la configurano
+NO_RETRY = RetryPolicy()
+
+
+class CircuitBreaker:
+    """Smette di chiamare un canale dopo N fallimenti consecutivi.
+
+    Dopo 'cooldown' secondi passa a half_open e lascia passare una sola
+    consegna di prova (una per cooldown): se riesce il circuito si
+    richiude, altrimenti si riapre per un altro cooldown.
+    """
+
+    __slots__ = (
+        "channel", "threshold", "cooldown", "failures", "opened_at",
+        "_state", "_on_change",
+    )
+
+    def __init__(self, channel: str, threshold: int, cooldown: float, on_change=None):
+        self.channel = channel
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._state = CIRCUIT_CLOSED
+        self._on_change = on_change
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self._state == CIRCUIT_OPEN
+
+    def ready(self) -> bool:
+        """Come allow(), ma senza consumare la prova in half_open."""
+        return self._state == CIRCUIT_CLOSED or time.monotonic() - self.opened_at >= self.cooldown
+
+    def allow(self) -> bool:
+        """True se una nuova consegna può partire (consuma la prova in half_open)."""
+        if self._state == CIRCUIT_CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.cooldown:
+            return False
+        # Nuova prova (anche se la precedente non ha mai riportato un esito)
+        self.opened_at = now
+        if self._state == CIRCUIT_OPEN:
+            self._set_state(CIRCUIT_HALF_OPEN)
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self._state != CIRCUIT_CLOSED:
+            self._set_state(CIRCUIT_CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == CIRCUIT_HALF_OPEN or (
+            self._state == CIRCUIT_CLOSED and self.failures >= self.threshold
+        ):
+            self.opened_at = time.monotonic()
+            self._set_state(CIRCUIT_OPEN)
+
+    def _set_state(self, state: str):
+        self._state = state
+        _LOGGER.warning(
+            "UniNotifier: Circuito del canale '%s' -> %s (%d errori consecutivi)",
+            self.channel, state, self.failures,
+        )
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def as_dict(self) -> dict:
+        return {"state": self._state, "failures": self.failures}
+
+
+class TokenBucket:
+    """Rate limit di un canale: 'rate' chiamate al secondo, raffiche fino a 'burst'.
+
+    'overflow' e 'max_queue' descrivono cosa fare dei job in attesa di un
+    token (applicati dallo scheduler al momento dell'accodamento).
+    """
+
+    __slots__ = ("rate", "burst", "overflow", "max_queue", "_tokens", "_updated")
+
+    def __init__(
+        self, rate: float, burst: int = 1, overflow: str = OVERFLOW_QUEUE,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        self._tokens = None
+        self.reconfigure(rate, burst, overflow, max_queue)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def reconfigure(
+        self, rate: float, burst: int = 1, overflow: str = OVERFLOW_QUEUE,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        """Nuovi parametri (reload) mantenendo i token già accumulati."""
+        if self._tokens is not None:
+            self._refill()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.overflow = overflow
+        self.max_queue = max_queue
+        if self._tokens is not None:
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """Token disponibili in questo momento."""
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, priority: bool = False):
+        """Attende un token; le chiamate prioritarie lo prendono se c'è, ma non attendono."""
+        self._refill()
+        while self._tokens < 1 and not priority:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._refill()
+        self._tokens = max(0.0, self._tokens - 1)
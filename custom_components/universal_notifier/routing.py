@@ -0,0 +1,253 @@
+# /config/custom_components/universal_notifier/routing.py
+
+"""Compilazione dei canali in un piano di instradamento immutabile."""
+
+from fnmatch import fnmatchcase
+from types import MappingProxyType
+
+import voluptuous as vol
+
+from .const import (
+    CONF_SERVICE, CONF_SERVICE_DATA, CONF_TARGET, CONF_IS_VOICE, CONF_ALT_SERVICES,
+    CONF_TIMEOUT, DEFAULT_TIMEOUT, CONF_RETRY, CONF_ATTEMPTS, CONF_BACKOFF,
+    CONF_MAX_BACKOFF, CONF_JITTER, CONF_RETRY_ON, CONF_DND_POLICY, DEFAULT_DND_POLICY,
+    CONF_FANOUT, DEFAULT_FANOUT, CONF_SPLIT_SENTENCES, DEFAULT_SPLIT_SENTENCES,
+    CONF_TAGS, TAG_PREFIX, GLOB_CACHE_SIZE, CONF_JOURNAL_TTL, DEFAULT_JOURNAL_TTL,
+)
+from .resilience import NO_RETRY, RetryPolicy
+
+_EMPTY = MappingProxyType({})
+
+
+class _Frozen:
+    """Base per oggetti compilati: attributi assegnabili solo in __init__."""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} è immutabile")
+
+    def _init(self, **values):
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+
+class ServiceVariant(_Frozen):
+    """Servizio pre-risolto di un canale (principale o alt_service)."""
+
+    __slots__ = (
+        "service", "domain", "name", "service_data", "is_voice",
+        "parse_mode", "media_players", "provider_entity",
+    )
+
+    def __init__(self, service: str, service_data: dict, is_voice: bool, targets: tuple):
+        try:
+            domain, name = service.split(".", 1)
+        except (AttributeError, ValueError):
+            raise vol.Invalid(f"Servizio non valido '{service}' (formato atteso: dominio.servizio)")
+        if not domain or not name:
+            raise vol.Invalid(f"Servizio non valido '{service}' (formato atteso: dominio.servizio)")
+
+        service_data = dict(service_data or {})
+
+        # Player fisici: media_player_entity_id (tts) + target del canale (notify/alexa).
+        # Per i tts il target è il provider (provider_entity), non un player.
+        tts_players = service_data.get("media_player_entity_id", [])
+        if isinstance(tts_players, str):
+            tts_players = [tts_players]
+        media_players = tuple(tts_players)
+        if is_voice and domain != "tts":
+            media_players += targets
+
+        self._init(
+            service=service,
+            domain=domain,
+            name=name,
+            service_data=MappingProxyType(service_data),
+            is_voice=is_voice,
+            # Telegram usa l'HTML come parse_mode di default
+            parse_mode="html" if domain == "telegram_bot" else None,
+            media_players=media_players,
+            # Provider TTS (es. tts.google_translate) passato come entity_id
+            provider_entity=targets[0] if domain == "tts" and targets else None,
+        )
+
+    def __repr__(self):
+        return f"<ServiceVariant {self.service} voice={self.is_voice}>"
+
+
+class ChannelRoute(_Frozen):
+    """Piano di instradamento compilato per un alias di canale."""
+
+    __slots__ = (
+        "alias", "targets", "chat_ids", "fanout", "split_sentences", "tags", "timeout",
+        "retry", "dnd_policy", "journal_ttl", "default", "alt_services",
+    )
+
+    def __init__(self, alias: str, channel_conf: dict):
+        targets = channel_conf.get(CONF_TARGET) or []
+        if isinstance(targets, str):
+            targets = [targets]
+        targets = tuple(targets)
+
+        default = ServiceVariant(
+            channel_conf[CONF_SERVICE],
+            channel_conf.get(CONF_SERVICE_DATA),
+            channel_conf.get(CONF_IS_VOICE, False),
+            targets,
+        )
+
+        alt_services = {}
+        for service_type, alt_conf in (channel_conf.get(CONF_ALT_SERVICES) or {}).items():
+            if not isinstance(alt_conf, dict) or CONF_SERVICE not in alt_conf:
+                raise vol.Invalid(f"alt_services '{service_type}' senza '{CONF_SERVICE}'")
+            # Le varianti alternative (foto, annunci...) non sono mai vocali
+            alt_services[service_type] = ServiceVariant(
+                alt_conf[CONF_SERVICE], alt_conf.get(CONF_SERVICE_DATA), False, targets
+            )
+
+        # Chat Telegram normalizzate una sola volta (il servizio vuole interi)
+        chat_ids = ()
+        if any(v.domain == "telegram_bot" for v in (default, *alt_services.values())):
+            chat_ids = _chat_ids(targets)
+
+        self._init(
+            alias=alias,
+            targets=targets,
+            chat_ids=chat_ids,
+            fanout=channel_conf.get(CONF_FANOUT, DEFAULT_FANOUT),
+            split_sentences=channel_conf.get(CONF_SPLIT_SENTENCES, DEFAULT_SPLIT_SENTENCES),
+            tags=tuple(channel_conf.get(CONF_TAGS) or ()),
+            timeout=channel_conf.get(CONF_TIMEOUT, DEFAULT_TIMEOUT),
+            retry=_retry_policy(channel_conf.get(CONF_RETRY)),
+            dnd_policy=channel_conf.get(CONF_DND_POLICY, DEFAULT_DND_POLICY),
+            journal_ttl=channel_conf.get(CONF_JOURNAL_TTL, DEFAULT_JOURNAL_TTL),
+            default=default,
+            alt_services=MappingProxyType(alt_services) if alt_services else _EMPTY,
+        )
+
+    def variant(self, service_type) -> ServiceVariant:
+        """Restituisce la variante per il 'type' richiesto (o quella principale)."""
+        if service_type:
+            return self.alt_services.get(service_type, self.default)
+        return self.default
+
+    def __repr__(self):
+        return f"<ChannelRoute {self.alias} -> {self.default.service}>"
+
+
+def _chat_ids(targets: tuple) -> tuple:
+    """chat_id Telegram come interi, senza duplicati e nell'ordine configurato."""
+    chat_ids = []
+    for target in targets:
+        try:
+            chat_id = int(target)
+        except (TypeError, ValueError):
+            raise vol.Invalid(f"chat_id Telegram non valido '{target}'")
+        if chat_id not in chat_ids:
+            chat_ids.append(chat_id)
+    return tuple(chat_ids)
+
+
+def _retry_policy(retry_conf: dict) -> RetryPolicy:
+    if not retry_conf:
+        return NO_RETRY
+    return RetryPolicy(
+        retry_conf[CONF_ATTEMPTS], retry_conf[CONF_BACKOFF],
+        retry_conf[CONF_MAX_BACKOFF], retry_conf[CONF_JITTER],
+        retry_conf[CONF_RETRY_ON],
+    )
+
+
+def build_routing_table(channels_conf: dict) -> dict:
+    """Compila tutti i canali; solleva vol.Invalid al primo canale errato."""
+    routes = {}
+    for alias, channel_conf in channels_conf.items():
+        try:
+            routes[alias] = ChannelRoute(alias, channel_conf)
+        except vol.Invalid as err:
+            raise vol.Invalid(f"Canale '{alias}': {err}") from err
+    return MappingProxyType(routes)
+
+
+def _is_glob(name: str) -> bool:
+    return any(char in name for char in "*?[")
+
+
+class TargetIndex:
+    """Espansione dei 'targets' del servizio in alias di canale.
+
+    Gruppi (anche annidati), tag ('tag:nome') e pattern glob usati nei
+    gruppi sono risolti una sola volta in tuple di alias senza duplicati:
+    a ogni chiamata basta una ricerca nel dizionario. I glob passati
+    direttamente al servizio vengono espansi alla prima chiamata e ricordati.
+    """
+
+    __slots__ = ("_aliases", "_index", "_globs")
+
+    def __init__(self, routes: dict, groups_conf: dict):
+        self._aliases = tuple(routes)
+        self._globs = {}
+
+        tags = {}
+        for alias, route in routes.items():
+            for tag in route.tags:
+                tags.setdefault(f"{TAG_PREFIX}{tag}", []).append(alias)
+
+        groups_conf = groups_conf or {}
+        for name in groups_conf:
+            if name in routes:
+                raise vol.Invalid(f"Il gruppo '{name}' ha lo stesso nome di un canale")
+
+        expanded = {}
+
+        def expand(name: str, trail: tuple) -> tuple:
+            if name in expanded:
+                return expanded[name]
+            if name in trail:
+                cycle = " -> ".join((*trail[trail.index(name):], name))
+                raise vol.Invalid(f"Gruppi in ciclo: {cycle}")
+            members = []
+            for member in groups_conf[name]:
+                if member in groups_conf:
+                    members.extend(expand(member, (*trail, name)))
+                elif member in routes:
+                    members.append(member)
+                elif member in tags:
+                    members.extend(tags[member])
+                elif _is_glob(member):
+                    members.extend(alias for alias in self._aliases if fnmatchcase(alias, member))
+                else:
+                    raise vol.Invalid(f"Gruppo '{name}': canale, gruppo o tag sconosciuto '{member}'")
+            expanded[name] = tuple(dict.fromkeys(members))
+            return expanded[name]
+
+        index = {alias: (alias,) for alias in routes}
+        index.update((tag, tuple(aliases)) for tag, aliases in tags.items())
+        for name in groups_conf:
+            index[name] = expand(name, ())
+        self._index = MappingProxyType(index)
+
+    def _glob(self, pattern: str):
+        members = self._globs.get(pattern)
+        if members is None:
+            members = tuple(alias for alias in self._aliases if fnmatchcase(alias, pattern))
+            if len(self._globs) >= GLOB_CACHE_SIZE:
+                self._globs.pop(next(iter(self._globs)))
+            self._globs[pattern] = members
+        return members or None
+
+    def resolve(self, names) -> tuple:
+        """Restituisce (alias in ordine e senza duplicati, nomi sconosciuti)."""
+        aliases = {}
+        unknown = []
+        for name in names:
+            members = self._index.get(name)
+            if members is None and _is_glob(name):
+                members = self._glob(name)
+            if members is None:
+                unknown.append(name)
+                continue
+            for alias in members:
+                aliases[alias] = None
+        return tuple(aliases), unknown
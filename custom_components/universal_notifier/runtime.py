@@ -0,0 +1,101 @@
+# /config/custom_components/universal_notifier/runtime.py
+
+"""Istantanea della configurazione compilata, sostituibile con un reload."""
+
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    CONF_CHANNELS, CONF_GROUPS, CONF_TIME_SLOTS, CONF_DND, CONF_GREETINGS,
+    CONF_CIRCUIT_BREAKER, CONF_THRESHOLD, CONF_COOLDOWN,
+    CONF_RATE_LIMIT, CONF_RATE, CONF_BURST, CONF_OVERFLOW, CONF_MAX_QUEUE,
+    DEFAULT_TIME_SLOTS, DEFAULT_DND, DEFAULT_GREETINGS,
+)
+from .resilience import CircuitBreaker, TokenBucket
+from .routing import TargetIndex, _Frozen, build_routing_table
+from .schedule import NotifierSchedule
+from .volume import VolumeCache
+
+
+class NotifierState(_Frozen):
+    """Tutto ciò che il servizio 'send' ricava dalla configurazione YAML.
+
+    Il servizio legge l'istantanea una volta all'inizio della chiamata: un
+    reload ne costruisce una nuova e la sostituisce in un colpo solo,
+    mentre le chiamate già partite finiscono sulla vecchia. Gli oggetti con
+    stato (circuit breaker, token bucket, cache del volume) passano dalla
+    precedente alla nuova per alias, con i parametri aggiornati.
+    Solleva vol.Invalid se i canali o i gruppi non sono validi.
+    """
+
+    __slots__ = (
+        "conf", "routing_table", "target_index", "schedule", "greetings",
+        "breakers", "buckets", "volume_cache",
+    )
+
+    def __init__(
+        self, hass: HomeAssistant, conf: dict, previous: "NotifierState" = None,
+        on_circuit_change=None,
+    ):
+        routing_table = build_routing_table(conf[CONF_CHANNELS])
+        target_index = TargetIndex(routing_table, conf.get(CONF_GROUPS))
+
+        old_breakers = previous.breakers if previous is not None else {}
+        breakers = {}
+        for alias, channel_conf in conf[CONF_CHANNELS].items():
+            breaker_conf = channel_conf.get(CONF_CIRCUIT_BREAKER)
+            if breaker_conf is None:
+                continue
+            breaker = old_breakers.get(alias)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    alias, breaker_conf[CONF_THRESHOLD], breaker_conf[CONF_COOLDOWN], on_circuit_change,
+                )
+            else:
+                breaker.threshold = breaker_conf[CONF_THRESHOLD]
+                breaker.cooldown = breaker_conf[CONF_COOLDOWN]
+            breakers[alias] = breaker
+
+        old_buckets = previous.buckets if previous is not None else {}
+        buckets = {}
+        for alias, channel_conf in conf[CONF_CHANNELS].items():
+            rate_conf = channel_conf.get(CONF_RATE_LIMIT)
+            if rate_conf is None:
+                continue
+            bucket = old_buckets.get(alias)
+            params = (
+                rate_conf[CONF_RATE], rate_conf[CONF_BURST],
+                rate_conf[CONF_OVERFLOW], rate_conf[CONF_MAX_QUEUE],
+            )
+            if bucket is None:
+                bucket = TokenBucket(*params)
+            else:
+                bucket.reconfigure(*params)
+            buckets[alias] = bucket
+
+        # Player dei canali vocali: se non cambiano la cache resta quella attiva
+        players = sorted({
+            player
+            for route in routing_table.values() if route.default.is_voice
+            for player in route.default.media_players
+        })
+        volume_cache = previous.volume_cache if previous is not None else None
+        if volume_cache is None or volume_cache.players != players:
+            volume_cache = VolumeCache(hass, players)
+
+        self._init(
+            conf=conf,
+            routing_table=routing_table,
+            target_index=target_index,
+            # Fasce orarie e DND analizzate una sola volta
+            schedule=NotifierSchedule(
+                conf.get(CONF_TIME_SLOTS, DEFAULT_TIME_SLOTS),
+                conf.get(CONF_DND, DEFAULT_DND),
+            ),
+            greetings=conf.get(CONF_GREETINGS, DEFAULT_GREETINGS),
+            breakers=breakers,
+            buckets=buckets,
+            volume_cache=volume_cache,
+        )
+
+    def __repr__(self):
+        return f"<NotifierState {len(self.routing_table)} canali>"
@@ -0,0 +1,132 @@
+# /config/custom_components/universal_notifier/schedule.py
+
+"""Fasce orarie e DND pre-calcolate, con cache fino al prossimo confine."""
+
+import logging
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+
+from homeassistant.util import dt as dt_util
+
+from .const import DEFAULT_TIME_SLOTS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Slot usato se nessun orario di inizio è valido
+FALLBACK_SLOT = ("default", 0.2)
+
+
+def _parse(value, what: str):
+    """Parsing di un orario di configurazione (None se non valido)."""
+    parsed = dt_util.parse_time(value) if value else None
+    if parsed is None:
+        _LOGGER.warning("UniNotifier: Orario non valido per %s: %r (ignorato)", what, value)
+    return parsed
+
+
+def _after(value: time) -> time:
+    """Istante immediatamente successivo a 'value' (il DND include l'estremo finale)."""
+    return (datetime.combine(date.min, value) + timedelta(microseconds=1)).time()
+
+
+class NotifierSchedule:
+    """Risolve (slot, volume, dnd_attivo) per un istante.
+
+    Gli orari sono analizzati una sola volta; la ricerca usa bisect sugli
+    inizi ordinati e il risultato resta in cache fino al prossimo confine
+    (inizio di uno slot o bordo del DND), calcolato anche oltre la mezzanotte.
+    """
+
+    __slots__ = (
+        "_starts", "_slots", "_dnd", "_boundaries",
+        "_cached", "_valid_from", "_valid_until",
+    )
+
+    def __init__(self, slots_conf: dict, dnd_conf: dict):
+        # Se la config è vuota, usiamo i default di const.py
+        if not slots_conf:
+            slots_conf = DEFAULT_TIME_SLOTS
+
+        parsed = []
+        for name, data in slots_conf.items():
+            start = _parse(data.get("start"), f"lo slot '{name}'")
+            if start is not None:
+                parsed.append((start, name, data.get("volume", 0.2)))
+        parsed.sort(key=lambda x: x[0])
+
+        self._starts = [start for start, _, _ in parsed]
+        self._slots = [(name, volume) for _, name, volume in parsed]
+
+        dnd = None
+        if dnd_conf:
+            dnd_start = _parse(dnd_conf.get("start"), "l'inizio del DND")
+            dnd_end = _parse(dnd_conf.get("end"), "la fine del DND")
+            if dnd_start is not None and dnd_end is not None:
+                dnd = (dnd_start, dnd_end)
+        self._dnd = dnd
+
+        boundaries = set(self._starts)
+        if dnd:
+            boundaries.add(dnd[0])
+            boundaries.add(_after(dnd[1]))
+        self._boundaries = sorted(boundaries)
+
+        self._cached = None
+        self._valid_from = None
+        self._valid_until = None
+
+    def is_dnd(self, now_time: time) -> bool:
+        """Controlla se l'orario è nel DND (gestisce accavallamento notte)."""
+        if self._dnd is None:
+            return False
+        start, end = self._dnd
+        if start <= end:
+            return start <= now_time <= end
+        return start <= now_time or now_time <= end
+
+    def slot(self, now_time: time) -> tuple:
+        """Restituisce (nome_slot, volume) per l'orario indicato."""
+        if not self._slots:
+            return FALLBACK_SLOT
+        # Prima dell'inizio del primo slot vale l'ultimo (caso "notte"): indice -1
+        return self._slots[bisect_right(self._starts, now_time) - 1]
+
+    @staticmethod
+    def _next_of(times: list, now: datetime):
+        """Primo istante (strettamente successivo a now) tra gli orari ordinati 'times'."""
+        if not times:
+            return None
+        idx = bisect_right(times, now.time())
+        day = now.date()
+        if idx == len(times):
+            # Nessun orario rimasto oggi: primo orario di domani
+            idx = 0
+            day += timedelta(days=1)
+        return datetime.combine(day, times[idx], tzinfo=now.tzinfo)
+
+    def next_boundary(self, now: datetime):
+        """Prossimo istante (strettamente successivo) in cui il contesto cambia."""
+        return self._next_of(self._boundaries, now)
+
+    def next_dnd_end(self, now: datetime):
+        """Primo istante dopo now in cui il DND non è più attivo (None se non configurato)."""
+        if self._dnd is None:
+            return None
+        return self._next_of([_after(self._dnd[1])], now)
+
+    def resolve(self, now: datetime) -> tuple:
+        """Restituisce (slot, volume, dnd_attivo) usando la cache se ancora valida."""
+        cached = self._cached
+        if cached is not None and self._valid_from <= now and (
+            self._valid_until is None or now < self._valid_until
+        ):
+            return cached
+
+        now_time = now.time()
+        slot_key, volume = self.slot(now_time)
+        cached = (slot_key, volume, self.is_dnd(now_time))
+
+        self._cached = cached
+        self._valid_from = now
+        self._valid_until = self.next_boundary(now)
+        return cached
@@ -0,0 +1,56 @@
+# /config/custom_components/universal_notifier/sensor.py
+
+"""Sensori diagnostici con le latenze di consegna per canale."""
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass, SensorEntity, SensorStateClass,
+)
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, METRICS_CALL, STAGE_CONTEXT, STAGE_DELIVERY
+from .metrics import DeliveryMetrics
+
+
+async def async_setup_platform(hass: HomeAssistant, config, async_add_entities, discovery_info=None):
+    """Caricata via discovery da async_setup quando le metriche sono attive."""
+    if discovery_info is None:
+        return
+    metrics = hass.data[DOMAIN]["metrics"]
+    # Il sensore della chiamata una sola volta: il reload passa solo i canali nuovi
+    sensors = [LatencySensor(metrics, METRICS_CALL, STAGE_CONTEXT)] if discovery_info["call"] else []
+    async_add_entities(
+        sensors
+        + [LatencySensor(metrics, channel, STAGE_DELIVERY) for channel in discovery_info["channels"]]
+    )
+
+
+class LatencySensor(SensorEntity):
+    """p95 di una fase; percentili, conteggi ed errori negli attributi."""
+
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_icon = "mdi:timer-outline"
+
+    def __init__(self, metrics: DeliveryMetrics, channel: str, stage: str):
+        self._metrics = metrics
+        self._channel = channel
+        self._stage = stage
+        self._attr_name = f"Universal Notifier {channel} latency"
+        self._attr_unique_id = f"{DOMAIN}_{channel}_latency"
+
+    @property
+    def native_value(self):
+        return self._metrics.channel(self._channel).latency(self._stage)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return self._metrics.channel(self._channel).as_dict()
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(
+            self._metrics.async_add_listener(self._channel, self.async_write_ha_state)
+        )
@@ -0,0 +1,138 @@
+# /config/custom_components/universal_notifier/volume.py
+
+"""Cache del volume dei media_player e attesa della fine della riproduzione."""
+
+import asyncio
+import logging
+
+from homeassistant.const import STATE_PLAYING
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_state_change_event
+
+from .const import VOLUME_TOLERANCE
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_VOLUME_LEVEL = "volume_level"
+
+
+class VolumeCache:
+    """Ultimo volume_level noto dei player usati dai canali vocali.
+
+    Popolata da hass.states all'avvio e aggiornata dai cambi di stato,
+    evita i volume_set verso player che sono già al livello richiesto.
+    I volume_set accodati e non ancora conclusi (ripristini compresi)
+    contano più dello stato: il livello atteso è l'ultimo accodato.
+    """
+
+    def __init__(self, hass: HomeAssistant, players):
+        self._hass = hass
+        self.players = sorted(set(players))
+        self._levels = {}
+        self._pending = {}  # player -> [ultimo livello accodato, volume_set in corso]
+        self._unsub = None
+
+    @callback
+    def async_start(self):
+        for player in self.players:
+            self._store(player, self._hass.states.get(player))
+        if self.players:
+            self._unsub = async_track_state_change_event(
+                self._hass, self.players, self._async_state_changed
+            )
+
+    @callback
+    def async_stop(self):
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _async_state_changed(self, event: Event):
+        self._store(event.data["entity_id"], event.data.get("new_state"))
+
+    def _store(self, player: str, state):
+        level = state.attributes.get(ATTR_VOLUME_LEVEL) if state is not None else None
+        if level is None:
+            self._levels.pop(player, None)
+        else:
+            self._levels[player] = level
+
+    def get(self, player: str):
+        """Volume atteso del player (None se sconosciuto o player spento)."""
+        pending = self._pending.get(player)
+        if pending is not None:
+            return pending[0]
+        return self._levels.get(player)
+
+    def differs(self, player: str, level: float) -> bool:
+        """True se serve un volume_set per portare il player a 'level'."""
+        current = self.get(player)
+        return current is None or abs(current - level) > VOLUME_TOLERANCE
+
+    @callback
+    def async_track_pending(self, player: str, level: float, done: asyncio.Future):
+        """Registra un volume_set accodato per il player, finché 'done' non è risolto."""
+        pending = self._pending.get(player)
+        if pending is None:
+            pending = self._pending[player] = [level, 0]
+        pending[0] = level
+        pending[1] += 1
+
+        @callback
+        def _async_done(_):
+            pending[1] -= 1
+            if not pending[1] and self._pending.get(player) is pending:
+                del self._pending[player]
+
+        done.add_done_callback(_async_done)
+
+
+async def async_wait_spoken(
+    hass: HomeAssistant, spoken: list, players, start_timeout: float, timeout: float,
+):
+    """Attende le consegne 'spoken' (future che non sollevano) e poi la fine della riproduzione."""
+    if spoken:
+        await asyncio.gather(*spoken)
+    await async_wait_playback(hass, players, start_timeout, timeout)
+
+
+async def async_wait_playback(
+    hass: HomeAssistant, players, start_timeout: float, timeout: float,
+):
+    """Attende che i player inizino (entro start_timeout) e finiscano di riprodurre.
+
+    Non solleva eccezioni: dopo 'timeout' secondi complessivi ritorna comunque.
+    """
+    players = list(players)
+    changed = asyncio.Event()
+
+    def is_playing() -> bool:
+        for player in players:
+            state = hass.states.get(player)
+            if state is not None and state.state == STATE_PLAYING:
+                return True
+        return False
+
+    @callback
+    def _async_changed(event: Event):
+        changed.set()
+
+    unsub = async_track_state_change_event(hass, players, _async_changed)
+    try:
+        async with asyncio.timeout(timeout):
+            try:
+                async with asyncio.timeout(start_timeout):
+                    while not is_playing():
+                        changed.clear()
+                        await changed.wait()
+            except TimeoutError:
+                # Riproduzione mai iniziata (o già conclusa)
+                return
+            while is_playing():
+                changed.clear()
+                await changed.wait()
+    except TimeoutError:
+        _LOGGER.debug("UniNotifier: %s ancora in riproduzione dopo %ss", players, timeout)
+    finally:
+        unsub()